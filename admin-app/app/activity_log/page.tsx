@@ -48,6 +48,8 @@ function ActivityLog(): JSX.Element {
   const [authorised, setAuthorised] = useState(true);
   const [activities, setActivities] = useState<Activity[]>([]);
   const [loading, setLoading] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [errorMsg, setErrorMsg] = useState<string | null>(null);
 
   // Filters
@@ -76,6 +78,7 @@ function ActivityLog(): JSX.Element {
           return null;
         }
         if (!res.ok) throw new Error("Failed to fetch activities");
+        setNextCursor(res.headers.get("X-Next-Cursor"));
         return res.json();
       })
       .then((data: Activity[] | null) => {
@@ -93,6 +96,29 @@ function ActivityLog(): JSX.Element {
     return () => ac.abort();
   }, [viewer]);
 
+  // Older activities are fetched a page at a time, following the cursor of the last page
+  const loadMore = () => {
+    if (!viewer || !nextCursor) return;
+    setLoadingMore(true);
+    fetch(
+      `http://localhost:5000/activities/${encodeURIComponent(
+        viewer
+      )}/viewactivities?cursor=${encodeURIComponent(nextCursor)}`
+    )
+      .then((res) => {
+        if (!res.ok) throw new Error("Failed to fetch activities");
+        setNextCursor(res.headers.get("X-Next-Cursor"));
+        return res.json();
+      })
+      .then((data: Activity[]) => setActivities((prev) => [...prev, ...data]))
+      .catch((err) => {
+        setErrorMsg("Error fetching activities");
+        // eslint-disable-next-line no-console
+        console.error(err);
+      })
+      .finally(() => setLoadingMore(false));
+  };
+
   const normalize = (s?: string) => (s ? s.toLowerCase() : "");
 
   const filtered = useMemo(() => {
@@ -268,6 +294,11 @@ function ActivityLog(): JSX.Element {
           <Text type="secondary" style={{ marginLeft: 8 }}>
             Showing {filtered.length} of {activities.length}
           </Text>
+          {nextCursor && (
+            <Button loading={loadingMore} onClick={loadMore}>
+              Load older activity
+            </Button>
+          )}
         </Space>
       </div>
 
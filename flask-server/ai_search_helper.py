@@ -1,7 +1,6 @@
 import os
 from flask import jsonify
 from langchain_openai import AzureOpenAIEmbeddings
-from langchain_community.document_loaders import AzureBlobStorageContainerLoader
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 from azure.search.documents.indexes import SearchIndexClient
@@ -12,29 +11,74 @@ from dotenv import load_dotenv
 import uuid
 from azure.storage.blob import BlobServiceClient
 from langchain.docstore.document import Document
-from common_helper import read_docx, read_pdf, read_pptx, read_txt
+from common_helper import read_docx, read_pdf, read_pptx, read_txt, file_iterators, spool_blob_to_tempfile, split_text_stream
+from embedding_helper import EmbeddingCache, CachedEmbeddings, EmbeddingDimensions, EmbeddingUsage, get_embedding_batcher
+from ingestion_helper import plan_file_update, delete_chunks_by_filenames, IngestionPipeline
+from parsing_helper import ParsingExecutor
+from indexing_helper import IndexWriter
+from search_client_helper import SearchClientRegistry
 from azure.core.exceptions import ResourceNotFoundError, HttpResponseError
 
-import chromadb
-from chromadb.config import Settings
-from langchain_community.embeddings import HuggingFaceEmbeddings
 
 load_dotenv()
 
 blob_service_client = BlobServiceClient.from_connection_string(os.environ.get('AZURE_CONN_STRING'))
 connection_string = os.environ.get('AZURE_CONN_STRING')
 
+EMBEDDING_MODEL = 'text-embedding-ada-002'
+
 embeddings = AzureOpenAIEmbeddings(
-            azure_deployment="text-embedding-ada-002", 
+            azure_deployment=EMBEDDING_MODEL, 
             api_key=os.environ.get('AZURE_OPENAI_API_KEY'),
             azure_endpoint=os.environ.get('AZURE_OPENAI_ENDPOINT'),
-            model='text-embedding-ada-002'
+            model=EMBEDDING_MODEL
         )
 
-sample_text = "Embeddings dimension finder"
-embedding_vector = embeddings.embed_query(sample_text)
-
-embedding_dimenison = len(embedding_vector)
+# Looked up when an index is created rather than probed at import
+embedding_dimensions = EmbeddingDimensions(
+    os.environ.get('EMBEDDING_DIMENSIONS_PATH', '.embedding_cache/dimensions.json')
+)
+
+def embedding_dimension():
+    return embedding_dimensions.get(EMBEDDING_MODEL, embeddings)
+
+# Chunks of re-uploaded files are looked up here before being sent to Azure OpenAI
+embedding_cache = EmbeddingCache(
+    os.environ.get('EMBEDDING_CACHE_PATH', '.embedding_cache/embeddings.sqlite3'),
+    max_entries=int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', 50000))
+)
+# Cache misses from every file are packed into shared, token-budgeted requests
+embedding_batcher = get_embedding_batcher(EMBEDDING_MODEL, embeddings)
+cached_embeddings = CachedEmbeddings(embedding_batcher, EMBEDDING_MODEL, embedding_cache)
+
+# Worker threads per storeDocuments stage, and the depth of the queues between them
+INGEST_DOWNLOAD_WORKERS = int(os.environ.get('INGEST_DOWNLOAD_WORKERS', 4))
+INGEST_SPLIT_WORKERS = int(os.environ.get('INGEST_SPLIT_WORKERS', 2))
+INGEST_EMBED_WORKERS = int(os.environ.get('INGEST_EMBED_WORKERS', 4))
+INGEST_UPLOAD_WORKERS = int(os.environ.get('INGEST_UPLOAD_WORKERS', 2))
+INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 8))
+
+parsing_executor = ParsingExecutor(
+    max_workers=int(os.environ.get('PARSE_MAX_WORKERS', 2)),
+    timeout=float(os.environ.get('PARSE_TIMEOUT_SECONDS', 300)),
+    max_pages_per_job=int(os.environ.get('PARSE_MAX_PAGES_PER_JOB', 50))
+)
+
+# Search clients share one keep-alive session and are reused across requests
+search_clients = SearchClientRegistry(
+    os.environ.get('AZURE_COGNITIVE_SEARCH_ENDPOINT'),
+    os.environ.get('AZURE_COGNITIVE_SEARCH_API_KEY'),
+    max_clients=int(os.environ.get('SEARCH_MAX_CLIENTS', 32)),
+    index_ttl_seconds=float(os.environ.get('SEARCH_INDEX_TTL_SECONDS', 60))
+)
+
+# Index actions are sent in payload-sized batches; failed keys are retried on their own
+index_writer = IndexWriter(
+    max_batch_bytes=int(os.environ.get('INDEX_BATCH_MAX_BYTES', 8 * 1024 * 1024)),
+    max_batch_actions=int(os.environ.get('INDEX_BATCH_MAX_ACTIONS', 1000)),
+    max_concurrency=int(os.environ.get('INDEX_MAX_CONCURRENCY', 4)),
+    max_retries=int(os.environ.get('INDEX_MAX_RETRIES', 3))
+)
 
 
 # def storeDocuments(containername, chunksize, overlap):
@@ -102,13 +146,10 @@ embedding_dimenison = len(embedding_vector)
 #         print(f"An error occurred: {e}")
 #         return e
 
-def ensure_index(index_name: str, endpoint: str, key: str, vector_dim: int):
-    index_client = SearchIndexClient(endpoint, AzureKeyCredential(key))
-    try:
-        index_client.get_index(index_name)
+def ensure_index(index_name: str, vector_dim: int):
+    if search_clients.index_exists(index_name):
         return  # exists
-    except ResourceNotFoundError:
-        pass
+    index_client = search_clients.get_index_client()
 
     fields = [
         SimpleField(name="id", type=SearchFieldDataType.String, key=True, searchable=True, filterable=True, retrievable=True),
@@ -128,82 +169,90 @@ def ensure_index(index_name: str, endpoint: str, key: str, vector_dim: int):
     )
     index = SearchIndex(name=index_name, fields=fields, vector_search=vector_search)
     index_client.create_or_update_index(index=index)
+    search_clients.mark_index(index_name)
 
-def storeDocuments(containername, chunksize, overlap):
+def storeDocuments(containername, chunksize, overlap, progress=None):
+    report = progress or (lambda filename, stage, error=None: None)
     try:
-        endpoint = os.environ.get('AZURE_COGNITIVE_SEARCH_ENDPOINT')
-        key = os.environ.get('AZURE_COGNITIVE_SEARCH_API_KEY')
-
         # Ensure index exists (auto-create if missing)
-        ensure_index(containername, endpoint, key, embedding_dimenison)
+        ensure_index(containername, embedding_dimension())
 
-        search_client = SearchClient(endpoint=endpoint, index_name=containername, credential=AzureKeyCredential(key))
-
-        loader = AzureBlobStorageContainerLoader(
-            conn_str=os.environ.get('AZURE_CONN_STRING'),
-            container=containername,
-            prefix='new/'
-        )
+        search_client = search_clients.get_search_client(containername)
+        container_client = blob_service_client.get_container_client(containername)
         text_splitter = CharacterTextSplitter(chunk_size=chunksize, chunk_overlap=overlap)
-        documents = loader.load()
-
-        docs_to_add_final, docs_to_update_final, docs_to_delete_final = [], [], []
-
-        for doc in documents:
-            split_docs = text_splitter.split_documents([doc])
-            filename = Path(doc.metadata['source']).name
-
-            search_results = list(search_client.search(search_text="*", filter=f"filename eq '{filename}'"))
-
-            if search_results:
-                docs_to_update_id = [r['id'] for r in search_results]
-                existing_chunks = len(docs_to_update_id)
-                new_chunks = len(split_docs)
-
-                new_embeddings = embeddings.embed_documents([s.page_content for s in split_docs])
-
-                for i in range(min(existing_chunks, new_chunks)):
-                    docs_to_update_final.append({
-                        'id': docs_to_update_id[i],
-                        'content': split_docs[i].page_content,
-                        'content_vector': new_embeddings[i],
-                        'filename': filename
-                    })
-
-                if new_chunks > existing_chunks:
-                    extras = split_docs[existing_chunks:]
-                    extra_vecs = embeddings.embed_documents([s.page_content for s in extras])
-                    for i, sdoc in enumerate(extras):
-                        docs_to_add_final.append({
-                            'id': str(uuid.uuid4()),
-                            'content': sdoc.page_content,
-                            'content_vector': extra_vecs[i],
-                            'filename': filename
-                        })
-                elif new_chunks < existing_chunks:
-                    for ex_id in docs_to_update_id[new_chunks:]:
-                        docs_to_delete_final.append({'id': ex_id})
-            else:
-                texts = [s.page_content for s in split_docs]
-                vecs = embeddings.embed_documents(texts)
-                for i, sdoc in enumerate(split_docs):
-                    docs_to_add_final.append({
-                        'id': str(uuid.uuid4()),
-                        'content': sdoc.page_content,
-                        'content_vector': vecs[i],
-                        'filename': filename
-                    })
-
-        if docs_to_update_final:
-            search_client.merge_documents(docs_to_update_final)
-        if docs_to_add_final:
-            search_client.upload_documents(docs_to_add_final)
-        if docs_to_delete_final:
-            search_client.delete_documents(docs_to_delete_final)
-
-        return "True"
-
-    except (ResourceNotFoundError, HttpResponseError) as e:
+        usage = EmbeddingUsage()
+
+        def download(item):
+            item['path'] = spool_blob_to_tempfile(
+                container_client.download_blob(item['blob_name']), suffix=Path(item['filename']).suffix
+            )
+            return item
+
+        def split(item):
+            path = item.pop('path')
+            try:
+                # Pages are split as the parser yields them
+                pages = parsing_executor.parse(path, Path(item['filename']).suffix.lower())
+                item['split_docs'] = [
+                    Document(page_content=chunk, metadata={"source": item['filename']})
+                    for chunk in split_text_stream(text_splitter, pages, chunksize)
+                ]
+                report(item['filename'], 'parsed')
+            finally:
+                os.remove(path)
+            report(item['filename'], 'chunked')
+            return item
+
+        def embed(item):
+            item['actions'] = plan_file_update(
+                search_client, cached_embeddings, item['filename'], item.pop('split_docs'), usage=usage
+            )
+            report(item['filename'], 'embedded')
+            return item
+
+        def upload(item):
+            merge_actions, add_actions, delete_actions, counts = item.pop('actions')
+            index_writer.apply(search_client, merge_actions, add_actions, delete_actions)
+            report(item['filename'], 'indexed')
+            return counts
+
+        def list_new_blobs():
+            for blob in container_client.list_blobs(name_starts_with='new/'):
+                if Path(blob.name).suffix.lower() in file_iterators:
+                    report(Path(blob.name).name, 'queued')
+                    yield {'blob_name': blob.name, 'filename': Path(blob.name).name}
+
+        pipeline = IngestionPipeline([
+            ('download', download, INGEST_DOWNLOAD_WORKERS),
+            ('split', split, INGEST_SPLIT_WORKERS),
+            ('embed', embed, INGEST_EMBED_WORKERS),
+            ('upload', upload, INGEST_UPLOAD_WORKERS),
+        ], queue_size=INGEST_QUEUE_SIZE)
+        file_counts, errors = pipeline.run(list_new_blobs())
+
+        for filename, stage, e in errors:
+            if filename:
+                report(filename, 'failed', error=f"{stage}: {e}")
+        if any(isinstance(e, ResourceNotFoundError) for _, _, e in errors):
+            # The index was deleted elsewhere; the next ingestion creates it again
+            search_clients.forget_index(containername)
+        if errors:
+            failed = ", ".join(f"{filename or containername} ({stage}: {e})" for filename, stage, e in errors)
+            return f"Failed to ingest: {failed}"
+
+        chunk_counts = {'kept': 0, 'merged': 0, 'added': 0, 'removed': 0}
+        for counts in file_counts:
+            for name, count in counts.items():
+                chunk_counts[name] += count
+
+        stats = {'files': len(file_counts), 'chunks': chunk_counts, 'embedding': usage.as_dict()}
+        print(f"Stored documents for {containername}: {stats}")
+        return stats
+
+    except ResourceNotFoundError as e:
+        search_clients.forget_index(containername)
+        return f"Search error: {e}"
+    except HttpResponseError as e:
         return f"Search error: {e}"
     except Exception as e:
         return f"{type(e).__name__}: {e}"
@@ -282,110 +331,55 @@ def storeDocuments(containername, chunksize, overlap):
 #         print(f"An error occurred: {e}")
 #         return False
 
-def moveToVectorStoreFunction(containername, domainname, versionid, chunksize, overlap, filename):
+def moveToVectorStoreFunction(containername, domainname, versionid, chunksize, overlap, filename, progress=None):
+    report = progress or (lambda filename, stage, error=None: None)
     try:
-        search_client = SearchClient(
-            endpoint=os.environ.get('AZURE_COGNITIVE_SEARCH_ENDPOINT'),
-            index_name=containername,
-            credential=AzureKeyCredential(os.environ.get('AZURE_COGNITIVE_SEARCH_API_KEY'))
-        )
+        search_client = search_clients.get_search_client(containername)
 
         text_splitter = CharacterTextSplitter(chunk_size=chunksize, chunk_overlap=overlap)
         blob_client = blob_service_client.get_blob_client(container=containername, 
                                                           blob=f"{domainname}/{filename}", version_id=versionid)
-        blob_content = blob_client.download_blob().readall()
-
-        file_readers = {
-            '.pdf': read_pdf,
-            '.docx': read_docx,
-            '.pptx': read_pptx,
-            '.txt': read_txt
-        }
         ext = Path(filename).suffix.lower()
-        if ext not in file_readers:
-            return jsonify({"error": "not a valid file"}), 500
-        
-        page_content = file_readers[ext](blob_content)
-        doc = Document(page_content=page_content, metadata={"source": filename})
-        filename_to_check = doc.metadata["source"]
-
-        search_results = list(search_client.search(filter=f"filename eq '{filename_to_check}'"))
-        docs_to_add_final = []
-        docs_to_update_final = []
-        docs_to_delete_final = []
-
-        split_docs = text_splitter.split_documents([doc])
-        new_chunks = len(split_docs)
-
-        if search_results:
-            print("update!")
-            docs_to_update_id = [result['id'] for result in search_results]
-            docs_to_update_page_content = [result['content'] for result in search_results]
-            docs_to_update_embeddings = embeddings.embed_documents([sdoc.page_content for sdoc in split_docs])
-            existing_chunks = len(docs_to_update_id)
-
-            # Update existing chunks and remove excess ones
-            for i in range(min(existing_chunks, new_chunks)):
-                docs_to_update_final.append({
-                    'id': docs_to_update_id[i],
-                    'content': split_docs[i].page_content,
-                    'content_vector': docs_to_update_embeddings[i],
-                    'filename': filename
-                })
-
-            # Add extra new chunks if present
-            if new_chunks > existing_chunks:
-                print("Adding new chunks...")
-                extra_docs = split_docs[existing_chunks:]
-                extra_embeddings = embeddings.embed_documents([sdoc.page_content for sdoc in extra_docs])
-                for i, sdoc in enumerate(extra_docs):
-                    docs_to_add_final.append({
-                        'id': str(uuid.uuid4()),
-                        'content': sdoc.page_content,
-                        'content_vector': extra_embeddings[i],
-                        'filename': filename
-                    })
-
-            # Remove extra chunks if the new document has fewer
-            elif new_chunks < existing_chunks:
-                print("Removing excess chunks...")
-                excess_ids = docs_to_update_id[new_chunks:]
-                for excess_id in excess_ids:
-                       docs_to_delete_final.append({'id': excess_id})
-
-            # Merge and clean up
-            search_client.merge_documents(docs_to_update_final)
-            if docs_to_delete_final:
-                print(docs_to_delete_final)
-                search_client.delete_documents(docs_to_delete_final)
-                print("document deleted")
-
-        else:
-            print("add!")
-            docs_to_add_page_content = [sdoc.page_content for sdoc in split_docs]
-            docs_to_add_embeddings = embeddings.embed_documents(docs_to_add_page_content)
-
-            docs_to_add_final = [
-                {
-                    'id': str(uuid.uuid4()),
-                    'content': docs_to_add_page_content[i],
-                    'content_vector': docs_to_add_embeddings[i],
-                    'filename': filename
-                } for i in range(len(docs_to_add_page_content))
+        if ext not in file_iterators:
+            print(f"Not a valid file: {filename}")
+            return False
+
+        path = spool_blob_to_tempfile(blob_client.download_blob(), suffix=ext)
+        try:
+            pages = parsing_executor.parse(path, ext)
+            split_docs = [
+                Document(page_content=chunk, metadata={"source": filename})
+                for chunk in split_text_stream(text_splitter, pages, chunksize)
             ]
-            search_client.upload_documents(docs_to_add_final)
+            report(filename, 'parsed')
+        finally:
+            os.remove(path)
+        report(filename, 'chunked')
+
+        usage = EmbeddingUsage()
+        merge_actions, add_actions, delete_actions, counts = plan_file_update(
+            search_client, cached_embeddings, filename, split_docs, usage=usage
+        )
+        report(filename, 'embedded')
+        index_writer.apply(search_client, merge_actions, add_actions, delete_actions)
+        report(filename, 'indexed')
 
-        return True
+        stats = {**counts, 'embedding': usage.as_dict()}
+        print(f"Re-indexed {filename}: {stats}")
+        return stats
 
     except Exception as e:
+        if isinstance(e, ResourceNotFoundError):
+            search_clients.forget_index(containername)
         print(f"An error occurred: {e}")
+        report(filename, 'failed', error=str(e))
         return False
 
 
     
 def  createIndexFunction(collection_name):
     try:
-        client = SearchIndexClient(os.environ.get('AZURE_COGNITIVE_SEARCH_ENDPOINT'), AzureKeyCredential(os.environ.get('AZURE_COGNITIVE_SEARCH_API_KEY')))
+        client = search_clients.get_index_client()
 
         print(client)
 
@@ -415,7 +409,7 @@ def  createIndexFunction(collection_name):
             name="content_vector", #content_vector
             type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
             searchable=True, 
-            vector_search_dimensions= embedding_dimenison, 
+            vector_search_dimensions= embedding_dimension(), 
             vector_search_profile_name="my-vector-config"),
 
         SearchableField(
@@ -434,6 +428,7 @@ def  createIndexFunction(collection_name):
     
         searchindex = SearchIndex(name=collection_name, fields=fields, vector_search=vector_search)
         result = client.create_or_update_index(index=searchindex)
+        search_clients.mark_index(collection_name)
 
         return True
 
@@ -442,31 +437,24 @@ def  createIndexFunction(collection_name):
         return False
     
 def delete_index_function(collection_name):
-    client = SearchIndexClient(os.environ.get('AZURE_COGNITIVE_SEARCH_ENDPOINT'), AzureKeyCredential(os.environ.get('AZURE_COGNITIVE_SEARCH_API_KEY')))
+    client = search_clients.get_index_client()
     try:
        client.delete_index(collection_name)
+       search_clients.forget_index(collection_name)
        return True
     except Exception as e:
         print(f"An error occurred: {e}")
         return False
     
 def delete_embeddings_function(blobName, collection_name):
-    search_client = SearchClient(os.environ.get('AZURE_COGNITIVE_SEARCH_ENDPOINT'), 
-          collection_name, AzureKeyCredential(os.environ.get('AZURE_COGNITIVE_SEARCH_API_KEY')))
+    search_client = search_clients.get_search_client(collection_name)
     try: 
         print(blobName)     
-        search_result = search_client.search(filter=f"filename eq '{blobName}'")
-        ids_to_delete = []
-        for result in search_result:
-            print(result['id'])
-            ids_to_delete.append({'id': result['id']})
-        
-        if(len(ids_to_delete) != 0):
-            search_client.delete_documents(ids_to_delete)
+        deleted = delete_chunks_by_filenames(search_client, index_writer, [blobName])
+        print(f"Deleted {deleted} chunks of {blobName}")
 
         return True
 
     except Exception as e:
         print(f"An error occurred: {e}")
         return False
-
@@ -0,0 +1,176 @@
+import os
+import time
+from datetime import datetime, timezone
+
+from pymongo import ReplaceOne
+
+SECONDS_PER_DAY = 86400
+
+# Messages are timestamped by the chat service when they are written; a refresh re-reads this much
+# before its high-water mark so messages that were still being saved are not missed
+ROLLUP_LAG_SECONDS = int(os.environ.get('ANALYTICS_ROLLUP_LAG_SECONDS', 3600))
+
+
+def day_string(day_start):
+    """
+    Format the start of a UTC day, in seconds since the epoch, as 'YYYY-MM-DD'.
+    """
+    return datetime.fromtimestamp(day_start, timezone.utc).date().isoformat()
+
+
+def rollup_pipeline(since=0):
+    """
+    Aggregation grouping the user messages of a conversations collection by UTC day, sentiment and emotion.
+    Messages without a numeric timestamp are grouped under a day_start of None.
+
+    Args:
+        since (float): Only messages recorded at or after this timestamp (seconds) are read; 0 reads every
+            message, including those without a timestamp. Default: 0.
+
+    Returns:
+        List[dict]: Pipeline stages.
+    """
+    timestamp = "$messages.recorded_on.timestamp"
+    message_match = {"messages.role": "user"}
+    pipeline = []
+    if since:
+        # Conversations without recent messages are skipped before anything is unwound
+        pipeline.append({"$match": {"messages.recorded_on.timestamp": {"$gte": since}}})
+        message_match["messages.recorded_on.timestamp"] = {"$gte": since}
+    return pipeline + [
+        {"$unwind": "$messages"},
+        {"$match": message_match},
+        {
+            "$group": {
+                "_id": {
+                    "day_start": {"$cond": [
+                        {"$isNumber": timestamp},
+                        {"$subtract": [timestamp, {"$mod": [timestamp, SECONDS_PER_DAY]}]},
+                        None
+                    ]},
+                    "sentiment": "$messages.sentiment",
+                    "emotion": "$messages.emotion",
+                },
+                "count": {"$sum": 1},
+                "users": {"$addToSet": "$user"},
+            }
+        },
+    ]
+
+
+def _add_count(counts, value, count):
+    for entry in counts:
+        if entry["value"] == value:
+            entry["count"] += count
+            return
+    counts.append({"value": value, "count": count})
+
+
+def build_day_rollups(conversations, course_name, since=0):
+    """
+    Compute the per-day rollups of a course from its conversations.
+
+    Args:
+        conversations (Collection): The course's conversations collection. Required.
+        course_name (str): Course the rollups belong to. Required.
+        since (float): Start of the first day to compute, in seconds since the epoch. Default: 0.
+
+    Returns:
+        List[dict]: One document per day with queries, distinct users, sentiments and emotions.
+    """
+    days = {}
+    for group in conversations.aggregate(rollup_pipeline(since)):
+        day_start = group["_id"].get("day_start")
+        day_start = int(day_start) if day_start is not None else None
+        day = days.setdefault(day_start, {
+            "course_name": course_name,
+            "day": day_string(day_start) if day_start is not None else None,
+            "day_start": day_start,
+            "queries": 0,
+            "users": set(),
+            "sentiments": [],
+            "emotions": [],
+        })
+        day["queries"] += group["count"]
+        day["users"].update(group["users"])
+        _add_count(day["sentiments"], group["_id"].get("sentiment"), group["count"])
+        _add_count(day["emotions"], group["_id"].get("emotion"), group["count"])
+
+    rollups = []
+    # The bucket of messages without a timestamp, if any, comes first
+    for day_start in sorted(days, key=lambda d: (d is not None, d or 0)):
+        day = days[day_start]
+        day["users"] = sorted(user for user in day["users"] if user is not None)
+        day["users_count"] = len(day["users"])
+        rollups.append(day)
+    return rollups
+
+
+def refresh_course_rollups(rollups, state, conversations, course_name, full=False):
+    """
+    Bring the rollups of one course up to date from its high-water mark.
+
+    Whole days are recomputed and replaced rather than incremented, so a refresh that fails
+    half-way, or runs twice, leaves correct counts behind. Messages without a timestamp cannot be
+    placed after a high-water mark; their bucket is only rebuilt by a full refresh.
+
+    Args:
+        rollups (Collection): Collection of per-day rollup documents. Required.
+        state (Collection): Collection holding the high-water mark of each course. Required.
+        conversations (Collection): The course's conversations collection. Required.
+        course_name (str): Course name. Required.
+        full (bool): Rebuild from the first message instead of the high-water mark. Default: False.
+
+    Returns:
+        int: Number of days written.
+    """
+    started_at = time.time()
+    course_state = None if full else state.find_one({"course_name": course_name}, {"high_water_mark": 1})
+    since = 0
+    if course_state is not None:
+        since = course_state["high_water_mark"] - ROLLUP_LAG_SECONDS
+        since = max(0, since - since % SECONDS_PER_DAY)
+
+    day_rollups = build_day_rollups(conversations, course_name, since)
+    if day_rollups:
+        rollups.bulk_write([
+            ReplaceOne({"course_name": course_name, "day_start": day["day_start"]}, day, upsert=True)
+            for day in day_rollups
+        ], ordered=False)
+    state.update_one(
+        {"course_name": course_name},
+        {"$set": {"high_water_mark": started_at, "refreshed_on": started_at}},
+        upsert=True
+    )
+    return len(day_rollups)
+
+
+def merge_rollups(day_rollups):
+    """
+    Add up per-day rollups.
+
+    Args:
+        day_rollups (Iterable[dict]): Rollup documents. Required.
+
+    Returns:
+        dict: 'queries', 'months' {(year, month): count}, 'sentiments' and 'emotions' {value: count}.
+    """
+    totals = {"queries": 0, "months": {}, "sentiments": {}, "emotions": {}}
+    for day in day_rollups:
+        totals["queries"] += day["queries"]
+        # Messages without a timestamp count towards every total except the months
+        if day["day"] is not None:
+            year, month = int(day["day"][:4]), int(day["day"][5:7])
+            totals["months"][(year, month)] = totals["months"].get((year, month), 0) + day["queries"]
+        for field in ("sentiments", "emotions"):
+            for entry in day[field]:
+                totals[field][entry["value"]] = totals[field].get(entry["value"], 0) + entry["count"]
+    return totals
+
+
+if __name__ == "__main__":
+    # Backfill: rebuild the rollups of every course from all existing conversations
+    import sys
+    from mongo_helper import refresh_rollups
+
+    sys.exit(0 if refresh_rollups(full=True) else 1)
@@ -1,17 +1,21 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response
 import os
+import threading
 from flask_cors import CORS
-from mongo_helper import  create_document, delete_all_course_documents, delete_document,  get_documents, update_movement_document, get_chatlogs, upload_course, list_courses, upload_domain, get_domain_files, delete_domain_docs, get_course_files_count, get_domain_files_count, get_users_count, get_queries_count, get_queries_by_month, get_queries_by_course, get_user_sentiments, get_user_emotions, check_if_rec_exists, get_course_users,  detele_course_user, add_activity, view_activities, vi_add_course, check_if_course_exist, insert_video_indexing_progress  
-from blob_storage_helper import createContainer, delete_blob_storage_container, upload_to_azure_blob_storage, delete_from_azure_blob_storage,delete_domain_virtual_folder, generate_sas_token
-from ai_search_helper import storeDocuments, moveToVectorStoreFunction,createIndexFunction, delete_index_function, delete_embeddings_function
+from databaseservice.mongoClientRegistry import mongo_clients
+from mongo_helper import  create_document, delete_all_course_documents, delete_document,  get_documents, update_movement_document, get_chatlogs, upload_course, list_courses, upload_domain, get_domain_files, get_course_files_count, get_domain_files_count, get_users_count, get_queries_count, get_queries_by_month, get_queries_by_course, get_user_sentiments, get_user_emotions, check_if_rec_exists, get_course_users,  detele_course_user, add_activity, view_activities, ACTIVITY_PAGE_SIZE, vi_add_course, check_if_course_exist, insert_video_indexing_progress, ensure_indexes, run_rollup_refresher, dashboard_cache
+from blob_storage_helper import createContainer, delete_blob_storage_container, upload_to_azure_blob_storage, delete_from_azure_blob_storage, blob_url
+from ai_search_helper import storeDocuments, moveToVectorStoreFunction,createIndexFunction, delete_index_function, delete_embeddings_function, parsing_executor, index_writer
 # from ai_search_helper_local import (storeDocuments, moveToVectorStoreFunction, createIndexFunction, delete_index_function, delete_embeddings_function)
 from dotenv import load_dotenv
 from azure.storage.blob import BlobServiceClient
-from datetime import datetime
 # import pytz 
-from pytz import timezone,utc
 import requests
 from course_share_helper import get_access_token
+from ingestion_job_helper import IngestionJobManager, LocalJobStore, MongoJobStore
+from domain_teardown_helper import teardown_domain
+from time_helper import local_date_time, blob_date_time
+from concurrent.futures import ThreadPoolExecutor
 
 from brokerservice.brokerService import BrokerService
 from model import VideoDetails
@@ -20,13 +24,36 @@ from model import VideoDetails
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor"])
 
 blob_service_client = BlobServiceClient.from_connection_string(os.environ.get('AZURE_CONN_STRING'))
 graph_url = 'https://graph.microsoft.com/v1.0/'
 
 broker_service = BrokerService()
 
+# Job state lives in Mongo so any gunicorn worker can answer a status poll; 'local' keeps it in-process
+if os.environ.get('INGESTION_JOB_STORE', 'mongo') == 'local':
+    ingestion_job_store = LocalJobStore()
+else:
+    from mongo_helper import db
+    ingestion_job_store = MongoJobStore(db["ingestion_jobs"])
+ingestion_jobs = IngestionJobManager(
+    ingestion_job_store,
+    max_workers=int(os.environ.get('INGESTION_JOB_WORKERS', 2)),
+    heartbeat_seconds=float(os.environ.get('INGESTION_JOB_HEARTBEAT_SECONDS', 30)),
+    stale_seconds=float(os.environ.get('INGESTION_JOB_STALE_SECONDS', 300)),
+    retention_seconds=float(os.environ.get('INGESTION_JOB_RETENTION_SECONDS', 7 * 86400))
+)
+
+# Index creation is idempotent; it runs in the background so the worker starts serving at once
+threading.Thread(target=ensure_indexes, daemon=True).start()
+
+# Dashboard rollups are kept current by a background refresh; the first pass after a deploy backfills
+# any course that has none yet. Every worker starts the loop, but a Mongo lease lets one of them run each pass.
+threading.Thread(
+    target=run_rollup_refresher, args=(int(os.environ.get('ANALYTICS_ROLLUP_INTERVAL_SECONDS', 300)),), daemon=True
+).start()
+
 @app.route("/vectorstore", methods=['PUT'])
 def storeInVectorStore():
     data = request.json
@@ -36,8 +63,8 @@ def storeInVectorStore():
 
     result = storeDocuments(containername, chunksize, overlap)
 
-    if result == "True":
-        return jsonify({"message": "Data loaded into vectorstore successfully"}), 201
+    if isinstance(result, dict):
+        return jsonify({"message": "Data loaded into vectorstore successfully", "stats": result}), 201
     else:
         return jsonify({"error": str(result)}), 500
 
@@ -55,12 +82,68 @@ def moveToVectorStore():
 
     movement_status = moveToVectorStoreFunction(containername, domainname, versionid, chunksize, overlap, filename)
     print(movement_status)
-    if movement_status:  
-        return jsonify({"message": "Data moved into into vectorstore successfully"}), 201
+    if movement_status:
+        return jsonify({"message": "Data moved into into vectorstore successfully", "chunks": movement_status}), 201
     else:
         return jsonify({"message": "Data failed to move into store"}), 500
 
 
+@app.route("/vectorstore/jobs", methods=['PUT'])
+def submitVectorStoreJob():
+    data = request.json
+    params = {
+        "containername": data.get('containername'),
+        "chunksize": int(data.get('chunksize')),
+        "overlap": int(data.get('overlap'))
+    }
+    job_id = ingestion_jobs.submit("vectorstore", storeDocuments, params)
+    return jsonify({"message": "Ingestion job queued", "job_id": job_id}), 202
+
+
+@app.route("/movetovectorstore/jobs", methods=['PUT'])
+def submitMoveToVectorStoreJob():
+    data = request.json
+    params = {
+        "containername": data.get('containername'),
+        "domainname": data.get('domainname'),
+        "versionid": data.get('versionid'),
+        "chunksize": int(data.get('chunksize')),
+        "overlap": int(data.get('overlap')),
+        "filename": data.get('filename')
+    }
+    job_id = ingestion_jobs.submit("movetovectorstore", moveToVectorStoreFunction, params)
+    return jsonify({"message": "Ingestion job queued", "job_id": job_id}), 202
+
+
+@app.route("/jobs/<job_id>", methods=['GET'])
+def getIngestionJob(job_id):
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    job["job_id"] = job.pop("_id")
+    return jsonify(job), 200
+
+
+@app.route("/metrics/parsing", methods=['GET'])
+def parsingMetrics():
+    return jsonify(parsing_executor.stats()), 200
+
+
+@app.route("/metrics/indexing", methods=['GET'])
+def indexingMetrics():
+    return jsonify(index_writer.stats()), 200
+
+
+@app.route("/metrics/dashboardcache", methods=['GET'])
+def dashboardCacheMetrics():
+    return jsonify(dashboard_cache.stats()), 200
+
+
+@app.route("/metrics/mongo", methods=['GET'])
+def mongoMetrics():
+    return jsonify(mongo_clients.stats()), 200
+
+
 @app.route("/createindex", methods=['PUT'])
 def createIndex():
     data = request.json
@@ -109,12 +192,7 @@ def create_domain():
     try:
         upload_domain_success, message = upload_domain(domain_name, collection_name)
         if upload_domain_success:
-            timestamp_dt = utc.localize(datetime.utcnow())
-            local_tz = timezone('Asia/Singapore')
-            local_timestamp_dt = timestamp_dt.astimezone(local_tz)
-
-            date_str = local_timestamp_dt.date().isoformat()
-            time_str = local_timestamp_dt.strftime('%H:%M:%S')
+            date_str, time_str = local_date_time()
 
             activities.append({
                     "uername": username,
@@ -188,7 +266,7 @@ def upload_blob(collection_name, domain_name, username):
        
         upload_success = upload_to_azure_blob_storage(container_name, files, domain_name)
         if upload_success:
-            return jsonify({'message': 'Files uploaded succesfully to Azure Blob Storage'}), 201
+            return jsonify({'message': 'Files uploaded succesfully to Azure Blob Storage', 'uploads': upload_success['files']}), 201
 
         else:
             return jsonify({'error': 'Failed to upload files to Azure Blob Storage'}), 500
@@ -208,49 +286,21 @@ def upload_document(collection_name, domain_name, username):
     try:
         container_client = blob_service_client.get_container_client(container_name)
 
-        for file in files:
-            blob_path = f"{domain_name}/{file.filename}"
-            blob_client_direct = container_client.get_blob_client(blob_path)
+        # Properties of every file are fetched at once, so the wait is that of the slowest file
+        blob_paths = [f"{domain_name}/{file.filename}" for file in files]
+        with ThreadPoolExecutor(max_workers=max(1, min(len(blob_paths), 16))) as executor:
+            properties = list(executor.map(
+                lambda blob_path: container_client.get_blob_client(blob_path).get_blob_properties(), blob_paths
+            ))
 
-            # Properties
-            props = blob_client_direct.get_blob_properties()
+        for file, blob_path, props in zip(files, blob_paths, properties):
             version_id = getattr(props, "version_id", None)  # may be None
-            last_modified_utc = props.last_modified  # tz-aware datetime in UTC
-
-            # Derive local timestamp (Asia/Singapore)
-            local_tz = timezone('Asia/Singapore')
-
-            # Try to parse a time from version_id when available (Azure often returns ISO-like with 7-digit micros)
-            date_str = time_str = None
-            if isinstance(version_id, str):
-                try:
-                    # Normalize fractional seconds to 6 digits for strptime
-                    raw = version_id
-                    if raw.endswith('Z'):
-                        raw = raw[:-1]
-                        if '.' in raw:
-                            main, frac = raw.split('.', 1)
-                            frac = ''.join(ch for ch in frac if ch.isdigit())[:6]
-                            raw = f"{main}.{frac}Z"
-                        else:
-                            raw = f"{raw}Z"
-                    ts_utc = datetime.strptime(raw, '%Y-%m-%dT%H:%M:%S.%fZ')
-                    ts_utc = utc.localize(ts_utc)
-                    ts_local = ts_utc.astimezone(local_tz)
-                    date_str = ts_local.date().isoformat()
-                    time_str = ts_local.strftime('%H:%M:%S')
-                except Exception:
-                    # fallback to last_modified below
-                    pass
-
-            if not date_str or not time_str:
-                ts_local = last_modified_utc.astimezone(local_tz)
-                date_str = ts_local.date().isoformat()
-                time_str = ts_local.strftime('%H:%M:%S')
-
-            # SAS URL
-            sas_token = generate_sas_token(container_name, blob_path)
-            blob_url = f"https://{blob_service_client.account_name}.blob.core.windows.net/{container_name}/{blob_path}?{sas_token}"
+
+            # Local (Asia/Singapore) time of the version, falling back to last_modified
+            date_str, time_str = blob_date_time(version_id, props.last_modified)
+
+            # Stored without a SAS token; listings sign it when they are read
+            url = blob_url(container_name, blob_path)
 
             # Flag whether this file is vectorized (videos -> no)
             ext = os.path.splitext(file.filename)[1].lower()
@@ -260,7 +310,7 @@ def upload_document(collection_name, domain_name, username):
                 "course_name": container_name,
                 "domain": domain_name,
                 "name": file.filename,
-                "url": blob_url,
+                "url": url,
                 "blob_name": blob_path,
                 "version_id": version_id,               # may be None; that’s fine to store
                 "date_str": date_str,
@@ -329,21 +379,16 @@ def delete_domain():
     activities = []
     try:
         domain_docs = get_documents(username, course_name, domain_name)
-        for doc in domain_docs:
-            deletion_status = delete_embeddings_function(doc['name'], course_name)
-            if not deletion_status:
-                return jsonify({"message: Failed to delete embeddings"}), 500
-                    
-        delete_success_domain_folder = delete_domain_virtual_folder(course_name, domain_name)
-        if delete_success_domain_folder:
-            delete_success_domain_docs = delete_domain_docs(course_name, domain_name)
-            if delete_success_domain_docs:
-                timestamp_dt = utc.localize(datetime.utcnow())
-                local_tz = timezone('Asia/Singapore')
-                local_timestamp_dt = timestamp_dt.astimezone(local_tz)
-
-                date_str = local_timestamp_dt.date().isoformat()
-                time_str = local_timestamp_dt.strftime('%H:%M:%S')
+        if domain_docs == "403":
+            return jsonify({"error": "Access denied"}), 403
+        if domain_docs == "False":
+            return jsonify({'error': 'Internal server error'}), 500
+        filenames = [] if domain_docs == "404" else [doc['name'] for doc in domain_docs]
+
+        # Blobs, index chunks and file records are deleted in parallel
+        report = teardown_domain(course_name, domain_name, filenames)
+        if report["consistent"]:
+                date_str, time_str = local_date_time()
 
 
                 activities.append({
@@ -359,14 +404,12 @@ def delete_domain():
                 add_activity_status = add_activity(activities)
 
                 if add_activity_status:
-                   return jsonify({"message": "Domain deleted successfully!"}), 201
+                   return jsonify({"message": "Domain deleted successfully!", "report": report}), 201
                 else:
                     return jsonify({"message: Failed to add activity status"}), 500
 
-            else:
-                    return jsonify({"message: Failed to delete the domain documents"}), 500
         else:
-            return jsonify({'error': 'Failed to delete contaier'}), 500
+            return jsonify({"error": "Failed to delete the domain", "report": report}), 500
     except Exception as error:
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -389,12 +432,7 @@ def delete_file(collection_name, domain_name):
         if delete_success:
             delete_document_success =  delete_document(collection_name, file_id, is_root_blob, file_name)
             if delete_document_success:
-                timestamp_dt = utc.localize(datetime.utcnow())
-                local_tz = timezone('Asia/Singapore')
-                local_timestamp_dt = timestamp_dt.astimezone(local_tz)
-
-                date_str = local_timestamp_dt.date().isoformat()
-                time_str = local_timestamp_dt.strftime('%H:%M:%S')
+                date_str, time_str = local_date_time()
 
                 activities.append({
                                 "uername": username,
@@ -447,12 +485,7 @@ def update_movement():
     try:
         create_document_success = update_movement_document(collection_name, file_name, version_id)
         if create_document_success:
-            timestamp_dt = utc.localize(datetime.utcnow())
-            local_tz = timezone('Asia/Singapore')
-            local_timestamp_dt = timestamp_dt.astimezone(local_tz)
-
-            date_str = local_timestamp_dt.date().isoformat()
-            time_str = local_timestamp_dt.strftime('%H:%M:%S')
+            date_str, time_str = local_date_time()
 
             activities.append({
                             "uername": username,
@@ -525,7 +558,7 @@ def getTotalDomainFiles(course_name, domain_name):
     
 @app.route('/chats/totalUsers/<username>', methods = ['GET'])
 def getTotalUsers(username):
-    usersCount = get_users_count(username)
+    usersCount = dashboard_cache.get_or_compute('totalUsers', username, get_users_count)
     if usersCount == "False":
        return jsonify({'message': 'Error fetching files count'}), 500
     else:
@@ -533,7 +566,7 @@ def getTotalUsers(username):
     
 @app.route('/chats/totalQueries/<username>', methods = ['GET'])
 def getTotalQueries(username):
-    queriesCount = get_queries_count(username)
+    queriesCount = dashboard_cache.get_or_compute('totalQueries', username, get_queries_count)
     if queriesCount == "False":
        return jsonify({'message': 'Error fetching files count'}), 500
     else:
@@ -541,7 +574,7 @@ def getTotalQueries(username):
 
 @app.route('/chats/queriesByMonth/<username>', methods=['GET'])
 def getQueriesByMonth(username):
-    queries_by_month = get_queries_by_month(username)
+    queries_by_month = dashboard_cache.get_or_compute('queriesByMonth', username, get_queries_by_month)
     if queries_by_month == "False":
         return jsonify({'message': 'Error fetching files count'}), 500
     else:
@@ -549,7 +582,7 @@ def getQueriesByMonth(username):
     
 @app.route('/chats/queriesByCourse/<username>', methods=['GET'])
 def getQueriesByCourse(username):
-    queries_by_course = get_queries_by_course(username)
+    queries_by_course = dashboard_cache.get_or_compute('queriesByCourse', username, get_queries_by_course)
     if queries_by_course == "False":
         return jsonify({'message': 'Error fetching query count by course'}), 500
     else:
@@ -557,7 +590,7 @@ def getQueriesByCourse(username):
     
 @app.route('/chats/userSentiments/<username>', methods=['GET'])
 def getUserSentiments(username):
-    user_sentiments = get_user_sentiments(username)
+    user_sentiments = dashboard_cache.get_or_compute('userSentiments', username, get_user_sentiments)
     if user_sentiments == "False":
         return jsonify({'message': 'Error fetching user sentiments'}), 500
     else:
@@ -565,7 +598,7 @@ def getUserSentiments(username):
     
 @app.route('/chats/userEmotions/<username>', methods=['GET'])
 def getUserEmotions(username):
-    user_emotions = get_user_emotions(username)
+    user_emotions = dashboard_cache.get_or_compute('userEmotions', username, get_user_emotions)
     if user_emotions == "False":
         return jsonify({'message': 'Error fetching user emotions'}), 500
     else:
@@ -636,9 +669,17 @@ def invite_user():
 @app.route('/activities/<username>/viewactivities', methods=['GET'])  
 def get_activities(username):
     print(username)
-    activities = view_activities(username)
-    if activities is not False:
-        return jsonify(activities), 201
+    limit = request.args.get('limit', ACTIVITY_PAGE_SIZE, type=int)
+    page = view_activities(username, limit, request.args.get('cursor'))
+    if page == "400":
+        return jsonify({"message": "Invalid cursor"}), 400
+    elif page is not False:
+        activities, next_cursor = page
+        response = make_response(jsonify(activities), 201)
+        # The body stays a plain list; the next page is requested with ?cursor=<X-Next-Cursor>
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
     else:
         return jsonify({"message": "Error fetching activities"}), 500
     
@@ -0,0 +1,131 @@
+"""
+Times get_queries_count, get_course_files_count and get_domain_files_count over 100k conversations and
+file records, against the previous list-then-count implementation, and fails if a count path still
+fetches whole documents. mongomock stands in for the server, so the documents-transferred column is the
+meaningful one: with count_documents only the count crosses the network.
+Run from flask-server/: python benchmarks/bench_count_queries.py [documents]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "AZURE_CONN_STRING",
+    "DefaultEndpointsProtocol=https;AccountName=bench;AccountKey=YmVuY2g=;EndpointSuffix=core.windows.net"
+)
+
+import mongomock
+
+import mongo_helper
+
+DOCUMENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+COURSES = 4
+
+
+class CountingCollection:
+    # Counts the documents a cursor hands back; whole-document finds are what count paths must avoid
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def find(self, filter=None, projection=None, *args, **kwargs):
+        for doc in self._collection.find(filter, projection, *args, **kwargs):
+            self._counter["documents"] += 1
+            if projection is None:
+                self._counter["full_documents"] += 1
+            yield doc
+
+
+class CountingClient:
+    def __init__(self, client):
+        self._client = client
+        self.counter = {"documents": 0, "full_documents": 0}
+
+    def __getitem__(self, name):
+        return CountingDatabase(self._client[name], self.counter)
+
+
+class CountingDatabase:
+    def __init__(self, database, counter):
+        self._database = database
+        self.counter = counter
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name], self.counter)
+
+
+def get_queries_count_listed(username):
+    # The implementation before server-side counts, kept for comparison
+    course_results = mongo_helper.for_each_user_course(
+        username, lambda course_db, course: list(course_db["conversations"].find({"messages.role": "user"}))
+    )
+    return sum(len(course_queries) for course, course_queries in course_results)
+
+
+def get_course_files_count_listed(course_name):
+    return len(list(mongo_helper.db["uploaded_files"].find({"course_name": course_name, "name": {"$ne": "null"}})))
+
+
+def get_domain_files_count_listed(course_name, domain_name):
+    return len(list(mongo_helper.db["uploaded_files"].find(
+        {"course_name": course_name, "domain": domain_name, "name": {"$ne": "null"}}
+    )))
+
+
+def seed(client):
+    per_course = DOCUMENTS // COURSES
+    file_db = client["file_database"]
+    for c in range(COURSES):
+        course = f"course-{c}"
+        file_db["courses"].insert_one({"course_name": course, "user": "bench", "user_type": "root_user"})
+        client[course]["conversations"].insert_many([{
+            "user": f"student-{i % 500}",
+            "messages": [
+                {"role": "user", "content": "What is covered in week 3?" * 20},
+                {"role": "assistant", "content": "Week 3 covers graph algorithms." * 40},
+            ],
+        } for i in range(per_course)])
+    file_db["uploaded_files"].insert_many([{
+        "course_name": "course-0",
+        "domain": f"domain-{i % 10}",
+        "name": f"file-{i}.pdf",
+        "url": f"https://bench.blob.core.windows.net/course-0/domain-{i % 10}/file-{i}.pdf",
+        "version_id": f"2024-01-01T00:00:00.{i:07}Z",
+    } for i in range(DOCUMENTS)])
+
+
+def measure(fn, *args):
+    counter = mongo_helper.client.counter
+    counter["documents"] = counter["full_documents"] = 0
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start, counter["documents"], counter["full_documents"]
+
+
+if __name__ == "__main__":
+    base = mongomock.MongoClient()
+    seed(base)
+    mongo_helper.client = CountingClient(base)
+    mongo_helper.db = mongo_helper.client["file_database"]
+
+    cases = [
+        ("queries", get_queries_count_listed, mongo_helper.get_queries_count, ("bench",)),
+        ("course files", get_course_files_count_listed, mongo_helper.get_course_files_count, ("course-0",)),
+        ("domain files", get_domain_files_count_listed, mongo_helper.get_domain_files_count, ("course-0", "domain-3")),
+    ]
+    print(f"{'count':>13} {'result':>8} {'listed ms':>10} {'listed docs':>12} {'count ms':>9} {'count docs':>11}")
+    materialized = []
+    for name, listed, counted, args in cases:
+        old, old_seconds, old_docs, _ = measure(listed, *args)
+        new, new_seconds, new_docs, new_full = measure(counted, *args)
+        assert old == new, f"{name}: {old} != {new}"
+        if new_full:
+            materialized.append(name)
+        print(f"{name:>13} {new:>8} {old_seconds * 1000:>10.0f} {old_docs:>12} {new_seconds * 1000:>9.0f} {new_docs:>11}")
+
+    if materialized:
+        sys.exit(f"count paths fetching whole documents: {materialized}")
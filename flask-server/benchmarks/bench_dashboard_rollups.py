@@ -0,0 +1,129 @@
+"""
+Times the /chats dashboard queries (by month, by course, sentiments, emotions) computed from the raw
+conversations against the same queries read from the per-day rollups, and checks that both give the
+same answers, including after an incremental refresh. mongomock stands in for the server, so the times
+compare the work done per request rather than what a real server would take.
+Run from flask-server/: python benchmarks/bench_dashboard_rollups.py [conversations] [runs]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "AZURE_CONN_STRING",
+    "DefaultEndpointsProtocol=https;AccountName=bench;AccountKey=YmVuY2g=;EndpointSuffix=core.windows.net"
+)
+
+import mongomock
+from pymongo import ReplaceOne
+
+import mongo_helper
+
+CONVERSATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+RUNS = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+COURSES = 4
+SENTIMENTS = ["positive", "neutral", "negative"]
+EMOTIONS = ["joy", "confusion", "frustration", "curiosity"]
+DASHBOARD = [
+    mongo_helper.get_queries_by_month,
+    mongo_helper.get_queries_by_course,
+    mongo_helper.get_user_sentiments,
+    mongo_helper.get_user_emotions,
+]
+
+
+class ReplacingCollection:
+    # mongomock's bulk_write does not accept the operations of current pymongo, so they are applied one by one
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            assert isinstance(request, ReplaceOne)
+            self._collection.replace_one(request._filter, request._doc, upsert=request._upsert)
+
+
+def conversation(rng, start, end):
+    messages = []
+    for _ in range(rng.randint(1, 4)):
+        recorded_on = {"timestamp": rng.uniform(start, end)}
+        messages.append({"role": "user", "content": "How do I start the assignment?", "recorded_on": recorded_on,
+                         "sentiment": rng.choice(SENTIMENTS), "emotion": rng.choice(EMOTIONS)})
+        messages.append({"role": "assistant", "content": "Start with the handout." * 10, "recorded_on": recorded_on})
+    return {"user": f"student-{rng.randint(0, 499)}", "messages": messages}
+
+
+def seed(client, now):
+    rng = random.Random(0)
+    for c in range(COURSES):
+        course = f"course-{c}"
+        mongo_helper.db["courses"].insert_one({"course_name": course, "user": "bench", "user_type": "root_user"})
+        client[course]["conversations"].insert_many(
+            [conversation(rng, now - 365 * 86400, now - 86400) for _ in range(CONVERSATIONS // COURSES)]
+        )
+        # Older conversations recorded no timestamp; they still count everywhere except by month
+        untimed = conversation(rng, now - 86400, now - 86400)
+        for message in untimed["messages"]:
+            del message["recorded_on"]
+        client[course]["conversations"].insert_one(untimed)
+
+
+def user_messages_by_course(client):
+    # What the dashboards counted before rollups: every user message, with or without a timestamp
+    pipeline = [{"$unwind": "$messages"}, {"$match": {"messages.role": "user"}}, {"$group": {"_id": None, "count": {"$sum": 1}}}]
+    return [list(client[f"course-{c}"]["conversations"].aggregate(pipeline))[0]["count"] for c in range(COURSES)]
+
+
+def dashboard():
+    return [fn("bench") for fn in DASHBOARD]
+
+
+def timed(runs):
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        results = dashboard()
+        seconds.append(time.perf_counter() - start)
+    return results, statistics.median(seconds)
+
+
+if __name__ == "__main__":
+    now = time.time()
+    client = mongomock.MongoClient()
+    mongo_helper.client = client
+    mongo_helper.db = client["file_database"]
+    mongo_helper.analytics_rollups = ReplacingCollection(mongo_helper.db["analytics_rollups"])
+    mongo_helper.analytics_rollup_state = mongo_helper.db["analytics_rollup_state"]
+    seed(client, now)
+
+    live, live_seconds = timed(RUNS)
+
+    start = time.perf_counter()
+    assert mongo_helper.refresh_rollups(full=True)
+    backfill_seconds = time.perf_counter() - start
+    rolled_up, rollup_seconds = timed(RUNS)
+    assert live == rolled_up, "rollups disagree with the conversations"
+    assert rolled_up[1]["counts"] == user_messages_by_course(client), "user messages missing from the rollups"
+
+    # New messages land after the high-water mark; an incremental pass must match a full rebuild
+    rng = random.Random(1)
+    for c in range(COURSES):
+        client[f"course-{c}"]["conversations"].insert_many([conversation(rng, now - 60, now) for _ in range(100)])
+    start = time.perf_counter()
+    assert mongo_helper.refresh_rollups()
+    refresh_seconds = time.perf_counter() - start
+    incremental = dashboard()
+    assert mongo_helper.refresh_rollups(full=True)
+    assert incremental == dashboard(), "incremental refresh disagrees with a full rebuild"
+
+    print(f"{CONVERSATIONS} conversations in {COURSES} courses, "
+          f"{mongo_helper.db['analytics_rollups'].count_documents({})} rollup documents")
+    print(f"dashboard from conversations: {live_seconds * 1000:.0f} ms")
+    print(f"dashboard from rollups:       {rollup_seconds * 1000:.0f} ms")
+    print(f"backfill: {backfill_seconds * 1000:.0f} ms, incremental refresh: {refresh_seconds * 1000:.0f} ms")
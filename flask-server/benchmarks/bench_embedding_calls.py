@@ -0,0 +1,67 @@
+"""
+Counts embedding calls and tokens for re-ingesting files that grew, shrank or were edited.
+Run from flask-server/: python benchmarks/bench_embedding_calls.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+from embedding_helper import CachedEmbeddings, EmbeddingCache, EmbeddingUsage
+from ingestion_helper import plan_file_update
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[float(len(text))] * 8 for text in texts]
+
+
+class FakeSearchClient:
+    def __init__(self, chunks_by_file):
+        self.chunks_by_file = chunks_by_file
+
+    def search(self, filter=None, select=None):
+        filename = filter.split("'")[1]
+        return [{'id': f"{filename}-{i}", 'content': text} for i, text in enumerate(self.chunks_by_file.get(filename, []))]
+
+
+def run(files=50, chunks=40):
+    stored = {f"file{n}.pdf": [f"file {n} chunk {i}" for i in range(chunks)] for n in range(files)}
+    search_client = FakeSearchClient(stored)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = FakeEmbeddings()
+        embeddings = CachedEmbeddings(raw, "bench-model", EmbeddingCache(os.path.join(tmp, "cache.sqlite3")))
+        usage = EmbeddingUsage()
+
+        start = time.perf_counter()
+        for n, (filename, texts) in enumerate(stored.items()):
+            if n % 3 == 0:
+                new_texts = texts + [f"file {n} appended {i}" for i in range(5)]
+            elif n % 3 == 1:
+                new_texts = texts[:chunks - 5]
+            else:
+                new_texts = [f"file {n} inserted"] + texts
+            split_docs = [Document(page_content=text) for text in new_texts]
+            plan_file_update(search_client, embeddings, filename, split_docs, usage=usage)
+        elapsed = time.perf_counter() - start
+
+    stats = usage.as_dict()
+    grown = len(range(0, files, 3))
+    edited = len(range(2, files, 3))
+    expected_texts = grown * 5 + edited
+    print(f"files={files} chunks/file={chunks} elapsed={elapsed:.3f}s {stats}")
+    assert stats["calls"] == grown + edited, "more than one embedding call per changed file"
+    assert stats["texts"] == expected_texts, "unchanged chunks were re-embedded"
+
+
+if __name__ == "__main__":
+    run()
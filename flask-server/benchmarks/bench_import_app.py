@@ -0,0 +1,66 @@
+"""
+Times `import app` in fresh processes and records the network connections made while importing.
+Connections opened by the importing thread block start-up; background ones (e.g. Mongo monitors) do not.
+Placeholder credentials are used for any setting missing from the environment, so nothing is reachable.
+Importing app also needs a reachable Cosmos DB, since the repositories create their vector indexes
+when constructed; pass another module (e.g. ai_search_helper) to time it on its own.
+Run from flask-server/: python benchmarks/bench_import_app.py [runs] [module]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLACEHOLDER_ENV = {
+    "AZURE_CONN_STRING": "DefaultEndpointsProtocol=https;AccountName=bench;AccountKey=YmVuY2g=;EndpointSuffix=core.windows.net",
+    "AZURE_OPENAI_API_KEY": "bench",
+    "AZURE_OPENAI_ENDPOINT": "https://bench.openai.azure.com",
+    "OPENAI_API_VERSION": "2024-02-01",
+    "AZURE_COGNITIVE_SEARCH_ENDPOINT": "https://bench.search.windows.net",
+    "AZURE_COGNITIVE_SEARCH_API_KEY": "bench",
+    "MONGO_URI": "mongodb://127.0.0.1:1",
+    "COSMOS_MONGO_STRING": "mongodb://127.0.0.1:1",
+    "DB_NAME": "bench",
+    "EMBEDDING_MODEL": "text-embedding-ada-002",
+    "INGESTION_JOB_STORE": "local",
+}
+
+CHILD = """
+import json, socket, threading, time
+connections = []
+original_connect = socket.socket.connect
+def connect(self, address):
+    connections.append({"address": str(address), "blocking": threading.current_thread() is threading.main_thread()})
+    return original_connect(self, address)
+socket.socket.connect = connect
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print("BENCH " + json.dumps({"seconds": elapsed, "connections": connections}))
+"""
+
+
+def run_once(module):
+    env = {**PLACEHOLDER_ENV, **os.environ}
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.replace("{module}", module)], cwd=HERE, env=env, capture_output=True, text=True, timeout=300
+    )
+    for line in output.stdout.splitlines():
+        if line.startswith("BENCH "):
+            return json.loads(line[len("BENCH "):])
+    raise RuntimeError(output.stderr[-2000:])
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    module = sys.argv[2] if len(sys.argv) > 2 else "app"
+    results = [run_once(module) for _ in range(runs)]
+    seconds = [result["seconds"] for result in results]
+    blocking = [c["address"] for result in results for c in result["connections"] if c["blocking"]]
+
+    print(f"import {module} over {runs} runs: median {statistics.median(seconds) * 1000:.0f} ms, "
+          f"min {min(seconds) * 1000:.0f} ms, max {max(seconds) * 1000:.0f} ms")
+    print(f"blocking connections during import: {len(blocking)} {sorted(set(blocking))}")
@@ -0,0 +1,112 @@
+"""
+Counts Mongo round trips of create_document and add_activity for 10, 100 and 1000 files, against the
+previous per-file implementation. mongomock stands in for the server; its own processing time says
+nothing about a real server, so latency is reported as round trips times a network round-trip time.
+Run from flask-server/: python benchmarks/bench_mongo_bulk_writes.py [round_trip_ms]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "AZURE_CONN_STRING",
+    "DefaultEndpointsProtocol=https;AccountName=bench;AccountKey=YmVuY2g=;EndpointSuffix=core.windows.net"
+)
+
+import mongomock
+from pymongo import UpdateMany
+
+import mongo_helper
+
+ROUND_TRIP_MS = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+WRITE_METHODS = {"insert_one", "insert_many", "update_one", "update_many", "bulk_write"}
+
+
+class CountingCollection:
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name not in WRITE_METHODS:
+            return attribute
+
+        def call(*args, **kwargs):
+            self._counter["round_trips"] += 1
+            if name == "bulk_write":
+                return self._apply(*args)
+            return attribute(*args, **kwargs)
+        return call
+
+    def _apply(self, requests, *args):
+        # mongomock's bulk_write does not accept the operations of current pymongo, so they are
+        # applied one by one; the server would take them in a single round trip
+        for request in requests:
+            update = self._collection.update_many if isinstance(request, UpdateMany) else self._collection.update_one
+            update(request._filter, request._doc, upsert=request._upsert)
+
+
+class CountingDatabase:
+    def __init__(self, database):
+        self._database = database
+        self.counter = {"round_trips": 0}
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name], self.counter)
+
+
+def create_document_per_file(files):
+    # The implementation before bulk writes, kept for comparison
+    db = mongo_helper.db
+    for file in files:
+        db["uploaded_files"].update_many({"name": file['name'], "in_vector_store": "yes"}, {"$set": {"in_vector_store": "no"}})
+        db["uploaded_files"].update_many({"name": file['name'], "is_root_blob": "yes"}, {"$set": {"is_root_blob": "no"}})
+        db["uploaded_files"].update_one({"version_id": file['version_id']}, {"$set": file}, upsert=True)
+    return True
+
+
+def add_activity_per_file(activities):
+    for activity in activities:
+        mongo_helper.db["activity_log"].insert_one(activity)
+    return True
+
+
+def make_upload(count, generation):
+    files = [{
+        "course_name": "bench",
+        "domain": "lectures",
+        "name": f"file-{i}.pdf",
+        "url": f"https://bench.blob.core.windows.net/bench/lectures/file-{i}.pdf",
+        "blob_name": f"lectures/file-{i}.pdf",
+        "version_id": f"2024-01-01T00:00:{generation:02}.{i:07}Z",
+        "date_str": "2024-01-01",
+        "time_str": "08:00:00",
+        "in_vector_store": "yes",
+        "is_root_blob": "yes",
+    } for i in range(count)]
+    activities = [{"uername": "bench", "course_name": "bench", "domain": "lectures", "file": f["name"],
+                   "action": "Uploaded File", "date_str": "2024-01-01", "time_str": "08:00:00"} for f in files]
+    return files, activities
+
+
+def run(create, add, count):
+    mongo_helper.db = CountingDatabase(mongomock.MongoClient()["file_database"])
+    # A second upload of the same names exercises the demotion of older versions
+    for generation in range(2):
+        files, activities = make_upload(count, generation)
+        assert create(files) and add(activities)
+
+    uploaded = mongo_helper.db._database["uploaded_files"]
+    assert uploaded.count_documents({"is_root_blob": "yes"}) == count
+    assert uploaded.count_documents({"in_vector_store": "yes"}) == count
+    return mongo_helper.db.counter["round_trips"] // 2
+
+
+if __name__ == "__main__":
+    print(f"round trip: {ROUND_TRIP_MS:.1f} ms")
+    print(f"{'files':>6} {'per-file trips':>15} {'per-file ms':>12} {'bulk trips':>11} {'bulk ms':>9}")
+    for count in (10, 100, 1000):
+        old_trips = run(create_document_per_file, add_activity_per_file, count)
+        new_trips = run(mongo_helper.create_document, mongo_helper.add_activity, count)
+        print(f"{count:>6} {old_trips:>15} {old_trips * ROUND_TRIP_MS:>12.0f} {new_trips:>11} {new_trips * ROUND_TRIP_MS:>9.0f}")
@@ -0,0 +1,69 @@
+"""
+Compares peak RSS of the old whole-blob, string-concatenating PDF reader with the streaming
+reader and splitter in common_helper, each in a fresh process.
+Run from flask-server/: python benchmarks/bench_parse_memory.py [pages]
+"""
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+from langchain_text_splitters import CharacterTextSplitter
+
+from common_helper import iter_pdf_pages, split_text_stream
+
+
+def make_pdf(path, pages):
+    # Noise images stand in for scanned pages, so the blob is large relative to its text
+    document = fitz.open()
+    line = "Lecture handout line with enough words to fill the width of a page."
+    for _ in range(pages):
+        scan = fitz.Pixmap(fitz.csRGB, 200, 200, os.urandom(200 * 200 * 3), False)
+        page = document.new_page()
+        page.insert_image(fitz.Rect(40, 400, 560, 800), pixmap=scan)
+        page.insert_textbox(fitz.Rect(40, 40, 560, 390), "\n".join([line] * 30), fontsize=7)
+    document.save(path)
+
+
+def old_reader(path, splitter):
+    with open(path, "rb") as blob:
+        blob_data = blob.read()
+    with io.BytesIO(blob_data) as temp_file:
+        document = fitz.open("pdf", temp_file)
+        text = ""
+        for page_num in range(len(document)):
+            text += document.load_page(page_num).get_text()
+    return len(splitter.split_text(text))
+
+
+def new_reader(path, splitter):
+    return sum(1 for _ in split_text_stream(splitter, iter_pdf_pages(path), 1000, separator="\n"))
+
+
+def measure(name, path, results):
+    splitter = CharacterTextSplitter(separator="\n", chunk_size=1000, chunk_overlap=100)
+    reader = old_reader if name == "old" else new_reader
+    start = time.perf_counter()
+    chunks = reader(path, splitter)
+    results[name] = (chunks, time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "handout.pdf")
+        make_pdf(path, pages)
+        results = multiprocessing.Manager().dict()
+        for name in ("old", "new"):
+            process = multiprocessing.get_context("spawn").Process(target=measure, args=(name, path, results))
+            process.start()
+            process.join()
+    for name in ("old", "new"):
+        chunks, elapsed, peak_kb = results[name]
+        print(f"{name}: pages={pages} chunks={chunks} time={elapsed:.2f}s peak_rss={peak_kb / 1024:.1f} MiB")
@@ -0,0 +1,118 @@
+"""
+Compares view_activities with the previous per-course implementation as the activity log grows: queries
+sent and documents returned for the first page. It also walks every page to check that following the
+cursors returns each activity exactly once, newest first. mongomock stands in for the server and has no
+indexes, so its timings grow with the log; on a server the first page is read from the
+(course_name, date_str, time_str, _id) index and stops after one page.
+Run from flask-server/: python benchmarks/bench_view_activities.py [page_size]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "AZURE_CONN_STRING",
+    "DefaultEndpointsProtocol=https;AccountName=bench;AccountKey=YmVuY2g=;EndpointSuffix=core.windows.net"
+)
+
+import mongomock
+
+import mongo_helper
+
+PAGE_SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+COURSES = 20
+
+
+class CountingCollection:
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def find(self, *args, **kwargs):
+        self._counter["queries"] += 1
+        return CountingCursor(self._collection.find(*args, **kwargs), self._counter)
+
+
+class CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, *args, **kwargs):
+        self._cursor = self._cursor.limit(*args, **kwargs)
+        return self
+
+    def __iter__(self):
+        for doc in self._cursor:
+            self._counter["documents"] += 1
+            yield doc
+
+
+class CountingDatabase:
+    def __init__(self, database):
+        self._database = database
+        self.counter = {"queries": 0, "documents": 0}
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name], self.counter)
+
+
+def view_activities_per_course(username):
+    # The implementation before the single $in query, kept for comparison
+    activities = []
+    documents = list(mongo_helper.db["courses"].find({"user": username, "user_type": "root_user"}))
+    for doc in documents:
+        activities = activities + list(mongo_helper.db["activity_log"].find({"course_name": doc["course_name"]}))
+    return activities
+
+
+def seed(rows):
+    base = mongomock.MongoClient()["file_database"]
+    for c in range(COURSES):
+        base["courses"].insert_one({"course_name": f"course-{c}", "user": "bench", "user_type": "root_user"})
+    base["activity_log"].insert_many([{
+        "uername": f"ta-{i % 7}",
+        "course_name": f"course-{i % COURSES}",
+        "domain": f"week-{i % 13}",
+        "file": f"file-{i}.pdf",
+        "action": "Uploaded File",
+        "date_str": f"2024-{1 + i % 12:02}-{1 + i % 28:02}",
+        # Plenty of activities share a second, so the _id tiebreak is exercised
+        "time_str": f"{i % 24:02}:{i % 60:02}:00",
+        "notes": "x" * 200,
+    } for i in range(rows)])
+    mongo_helper.db = CountingDatabase(base)
+
+
+def measure(fn, *args):
+    mongo_helper.db.counter.update(queries=0, documents=0)
+    result = fn(*args)
+    return result, dict(mongo_helper.db.counter)
+
+
+if __name__ == "__main__":
+    print(f"{'activities':>10} {'old queries':>12} {'old docs':>9} {'page queries':>13} {'page docs':>10} {'pages':>6}")
+    for rows in (1000, 10000, 50000):
+        seed(rows)
+        _, old = measure(view_activities_per_course, "bench")
+        (first_page, cursor), new = measure(mongo_helper.view_activities, "bench", PAGE_SIZE)
+
+        seen = list(first_page)
+        pages = 1
+        while cursor:
+            page, cursor = mongo_helper.view_activities("bench", PAGE_SIZE, cursor)
+            seen.extend(page)
+            pages += 1
+        positions = [(a["date_str"], a["time_str"], a["_id"]) for a in seen]
+        assert len(set(a["_id"] for a in seen)) == rows, "pages skipped or repeated activities"
+        assert positions == sorted(positions, reverse=True), "pages are not newest first"
+        assert "notes" not in seen[0], "projection returned fields the admin app does not show"
+
+        print(f"{rows:>10} {old['queries']:>12} {old['documents']:>9} {new['queries']:>13} {new['documents']:>10} {pages:>6}")
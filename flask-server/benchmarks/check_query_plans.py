@@ -0,0 +1,20 @@
+"""
+Applies the file_database index specification and explains every helper query against the database
+in MONGO_URI, listing the ones still planned as a collection scan. Exits non-zero if any are found.
+Run from flask-server/: python benchmarks/check_query_plans.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mongo_helper import FILE_DB_QUERIES, ensure_indexes, find_collection_scans
+
+if __name__ == "__main__":
+    if not ensure_indexes():
+        sys.exit("Could not create the file_database indexes")
+    scans = find_collection_scans()
+    for collection, query in scans:
+        print(f"COLLSCAN {collection}: {query}")
+    print(f"{len(FILE_DB_QUERIES) - len(scans)} of {len(FILE_DB_QUERIES)} queries use an index")
+    sys.exit(1 if scans else 0)
@@ -1,8 +1,15 @@
 from azure.storage.blob import BlobServiceClient,generate_blob_sas, BlobSasPermissions, BlobClient
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from azure.core.exceptions import ResourceExistsError
 from azure.core.credentials import AzureNamedKeyCredential
+from dotenv import load_dotenv
+
+load_dotenv()
 
 
 
@@ -12,6 +19,11 @@ storage_account_key = os.environ.get('AZURE_STORAGE_KEY')
 
 blob_service_client = BlobServiceClient.from_connection_string(connection_string)
 
+# Sub-requests allowed in one blob batch request
+BLOB_BATCH_SIZE = 256
+# Files of one request uploaded at the same time
+BLOB_UPLOAD_CONCURRENCY = int(os.environ.get('BLOB_UPLOAD_CONCURRENCY', 4))
+
 
 def createContainer(containerName):
     try:
@@ -40,53 +52,89 @@ def delete_blob_storage_container(containerName):
         print(f"Error deleting container: {error}")
         return False
     
+def delete_blobs_in_batches(container_client, blob_names):
+    """
+    Delete blobs with batch requests of up to 256 blobs each. Blobs that are already gone count as deleted.
+
+    Args:
+        container_client (ContainerClient): Container of the blobs. Required.
+        blob_names (List[str]): Names of the blobs. Required.
+
+    Returns:
+        List[str]: Names of the blobs that could not be deleted.
+    """
+    failed = []
+    for start in range(0, len(blob_names), BLOB_BATCH_SIZE):
+        batch = blob_names[start:start + BLOB_BATCH_SIZE]
+        responses = container_client.delete_blobs(*batch, delete_snapshots="include", raise_on_any_failure=False)
+        for blob_name, response in zip(batch, responses):
+            if response.status_code not in (200, 202, 404):
+                failed.append(blob_name)
+    return failed
+
 def delete_domain_virtual_folder(containerName, domainName):
     try:
         container_client = blob_service_client.get_container_client(containerName.lower())
-        blob_list = container_client.list_blobs(name_starts_with=f"{domainName}/")
-        
-        for blob in blob_list:
-            blob_client = container_client.get_blob_client(blob)
-            blob_client.delete_blob()
-            print(f"Deleted blob: {blob.name}")
+        blob_names = [blob.name for blob in container_client.list_blobs(name_starts_with=f"{domainName}/")]
+
+        failed = delete_blobs_in_batches(container_client, blob_names)
+        if failed:
+            print(f"Error deleting blobs: {failed}")
+            return False
         
-        print("Virtual folder deleted successfully.")
+        print(f"Virtual folder deleted successfully. Deleted {len(blob_names)} blobs.")
         return True
     except Exception as error:
         print(f"Error deleting virtual folder: {error}")
         return False
     
+def _upload_file(container_client, file, domainName):
+    # One upload to the domain folder; the staging copy in new/ is made on the service side
+    start_time = time.perf_counter()
+    stream = file.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+
+    blob_client_direct = container_client.get_blob_client(f"{domainName}/{file.filename}")
+    upload_response = blob_client_direct.upload_blob(stream, length=size, overwrite=True, connection_timeout=600, max_concurrency=2)
+
+    blob_client_in_folder = container_client.get_blob_client(f"new/{file.filename}")
+    # Copies within the account are authorized by the account key and usually finish at once
+    copy_status = blob_client_in_folder.start_copy_from_url(blob_client_direct.url)['copy_status']
+    while copy_status == 'pending':
+        time.sleep(0.5)
+        copy_status = blob_client_in_folder.get_blob_properties().copy.status
+    if copy_status != 'success':
+        raise RuntimeError(f"Copy of {file.filename} to new/ ended with status {copy_status}")
+
+    elapsed = time.perf_counter() - start_time
+    print(f"File uploaded successfully. Request ID: {upload_response['request_id']}")
+    return {
+        "file": file.filename,
+        "bytes": size,
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(size / elapsed / (1024 * 1024), 2) if elapsed else None
+    }
+
 def upload_to_azure_blob_storage(containerName, files, domainName):
     try:
         container_client = blob_service_client.get_container_client(containerName)
 
-        # List and delete existing blobs with the "new/" prefix
-        blobs_list = container_client.list_blobs(name_starts_with="new/")
-        for blob in blobs_list:
-            blob_client = container_client.get_blob_client(blob)
-            blob_client.delete_blob()
-            print(f"Deleted blob: {blob.name}")
-        
-        for file in files:
-            # Upload to "new/" folder
-            blob_client_in_folder = container_client.get_blob_client(f"new/{file.filename}")
-            file.seek(0)  # Ensure the file stream is at the beginning
-            print("Going to upload file")
-            upload_response1 = blob_client_in_folder.upload_blob(file, overwrite=True, connection_timeout=600, max_concurrency=2)
-            print(f"File uploaded successfully to folder. Request ID: {upload_response1['request_id']}")
-            
-            # Upload directly to the container root
-          
-            blob_client_direct = container_client.get_blob_client(f"{domainName}/{file.filename}")
-            file.seek(0)  # Reset the file stream again to the beginning
-            upload_response2 = blob_client_direct.upload_blob(file, overwrite=True, connection_timeout=600)
-            print(f"File uploaded successfully to container. Request ID: {upload_response2['request_id']}")
-        
-        return True
+        # Clear the previous staging files in new/ with batch deletes
+        old_blobs = [blob.name for blob in container_client.list_blobs(name_starts_with="new/")]
+        failed = delete_blobs_in_batches(container_client, old_blobs)
+        if failed:
+            raise RuntimeError(f"Could not delete old blobs: {failed}")
+        print(f"Deleted {len(old_blobs)} blobs from new/")
+
+        with ThreadPoolExecutor(max_workers=BLOB_UPLOAD_CONCURRENCY) as executor:
+            uploads = list(executor.map(lambda file: _upload_file(container_client, file, domainName), files))
+
+        return {"files": uploads}
     except Exception as error:
         print(f"Error uploading file: {error}")
         return False
-
     
 def delete_from_azure_blob_storage(containerName, blobName, domainName, versionId, isRootBlob):
     try:
@@ -113,15 +161,104 @@ def delete_from_azure_blob_storage(containerName, blobName, domainName, versionI
         print(f"Error deleting file: {error}")
         return False
 
-def generate_sas_token(container_name, blob_name):
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-    sas_token = generate_blob_sas(
-        account_name=blob_service_client.account_name,
-        container_name=container_name,
-        blob_name=blob_name,
-        account_key=blob_service_client.credential.account_key,
-        permission=BlobSasPermissions(read=True),
-        expiry=datetime.utcnow() + timedelta(hours=1)  # Adjust expiry time as needed
-    )
-    return sas_token
+class SasUrlCache:
+    """
+    Issues read SAS URLs for blobs and reuses each one until shortly before it expires, so listings
+    do not re-sign every blob and stored records never hold an expired link.
+
+    Args:
+        ttl (timedelta): Lifetime of a new token. Default: 1 hour.
+        refresh_margin (timedelta): A cached token is replaced once it has less than this left. Default: 10 minutes.
+        max_entries (int): Tokens kept, least recently used dropped first. Default: 10000.
+    """
+
+    def __init__(self, ttl=timedelta(hours=1), refresh_margin=timedelta(minutes=10), max_entries: int = 10000):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()
+
+    def _sign(self, container_name, blob_name, permission, expiry):
+        return generate_blob_sas(
+            account_name=blob_service_client.account_name,
+            container_name=container_name,
+            blob_name=blob_name,
+            account_key=blob_service_client.credential.account_key,
+            permission=BlobSasPermissions.from_string(permission),
+            expiry=expiry
+        )
+
+    def get_tokens(self, container_name, blob_names, permission="r"):
+        """
+        Args:
+            container_name (str): Container of the blobs. Required.
+            blob_names (Iterable[str]): Blob names. Required.
+            permission (str): SAS permission string. Default: "r".
+
+        Returns:
+            dict: SAS token per blob name.
+        """
+        now = datetime.utcnow()
+        # Tokens signed together share one expiry
+        expiry = now + self.ttl
+        tokens = {}
+        with self._lock:
+            for blob_name in blob_names:
+                key = (container_name, blob_name, permission)
+                cached = self._tokens.get(key)
+                if cached is None or cached[1] - now < self.refresh_margin:
+                    cached = (self._sign(container_name, blob_name, permission, expiry), expiry)
+                    self._tokens[key] = cached
+                self._tokens.move_to_end(key)
+                tokens[blob_name] = cached[0]
+            while len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+        return tokens
+
+    def get_token(self, container_name, blob_name, permission="r"):
+        return self.get_tokens(container_name, [blob_name], permission)[blob_name]
+
+    def get_urls(self, container_name, blob_names, permission="r"):
+        """
+        Returns:
+            dict: SAS URL per blob name.
+        """
+        tokens = self.get_tokens(container_name, blob_names, permission)
+        return {blob_name: f"{blob_url(container_name, blob_name)}?{token}" for blob_name, token in tokens.items()}
+
 
+def blob_url(container_name, blob_name):
+    """URL of a blob without a SAS token."""
+    return f"https://{blob_service_client.account_name}.blob.core.windows.net/{container_name}/{blob_name}"
+
+
+def sign_document_urls(documents):
+    """
+    Replace the url of uploaded_files records with a current SAS URL, signing each course's blobs in one call.
+
+    Args:
+        documents (List[dict]): Records with 'course_name' and 'blob_name'. Required.
+
+    Returns:
+        List[dict]: The same records.
+    """
+    by_container = {}
+    for doc in documents:
+        if doc.get('blob_name') and doc['blob_name'] != 'null':
+            by_container.setdefault(doc['course_name'], []).append(doc)
+    for container_name, docs in by_container.items():
+        urls = sas_urls.get_urls(container_name, {doc['blob_name'] for doc in docs})
+        for doc in docs:
+            doc['url'] = urls[doc['blob_name']]
+    return documents
+
+
+sas_urls = SasUrlCache(
+    ttl=timedelta(minutes=int(os.environ.get('SAS_TTL_MINUTES', 60))),
+    refresh_margin=timedelta(minutes=int(os.environ.get('SAS_REFRESH_MARGIN_MINUTES', 10)))
+)
+
+
+def generate_sas_token(container_name, blob_name):
+    return sas_urls.get_token(container_name, blob_name)
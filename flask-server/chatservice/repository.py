@@ -55,15 +55,13 @@ class ChatDatabaseService:
             model=os.environ.get("EMBEDDING_MODEL")
         )
 
-        self.vector_store_prompt_index: AzureCosmosDBVectorSearch = AzureCosmosDBVectorSearch.from_connection_string(
-            connection_string=database_service.get_mongo_connection_string(),
-            namespace=f"{database_service.get_database_name()}.{prompt_content_index}",
+        self.vector_store_prompt_index: AzureCosmosDBVectorSearch = AzureCosmosDBVectorSearch(
+            collection=db[prompt_content_index],
             embedding=self.azure_openai_embeddings,
         )
 
-        self.vector_store_prompt_clean_index: AzureCosmosDBVectorSearch = AzureCosmosDBVectorSearch.from_connection_string(
-            connection_string=database_service.get_mongo_connection_string(),
-            namespace=f"{database_service.get_database_name()}.{prompt_collection_clean_name}",
+        self.vector_store_prompt_clean_index: AzureCosmosDBVectorSearch = AzureCosmosDBVectorSearch(
+            collection=db[prompt_collection_clean_name],
             embedding=self.azure_openai_embeddings,
         )
 
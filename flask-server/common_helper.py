@@ -1,36 +1,161 @@
 import fitz  # PyMuPDF
 import docx
 import io
+import os
+import re
+import tempfile
 from pptx import Presentation
 
-def read_pdf(blob_data):
-    with io.BytesIO(blob_data) as temp_file:
-        document = fitz.open("pdf", temp_file)
-        text = ""
+
+def _as_file(source):
+    # Readers accept a file path, a file-like object or raw bytes
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return source
+
+def iter_pdf_pages(source):
+    """Yield the text of each page of a PDF, one page loaded at a time."""
+    if isinstance(source, str):
+        document = fitz.open(source)
+    else:
+        document = fitz.open("pdf", _as_file(source))
+    with document:
         for page_num in range(len(document)):
-            page = document.load_page(page_num)
-            text += page.get_text()
-    return text
+            yield document.load_page(page_num).get_text()
+
+def iter_docx_paragraphs(source):
+    """Yield each paragraph of a DOCX followed by a newline."""
+    doc = docx.Document(_as_file(source))
+    for para in doc.paragraphs:
+        yield para.text + "\n"
+
+def iter_txt(source):
+    """Yield the lines of a UTF-8 text file."""
+    if isinstance(source, str):
+        with open(source, encoding='utf-8', newline='') as text_file:
+            yield from text_file
+    else:
+        with io.TextIOWrapper(_as_file(source), encoding='utf-8', newline='') as text_file:
+            yield from text_file
+
+def iter_pptx_slides(source):
+    """Yield the text of each slide of a PPTX, one line per text shape."""
+    presentation = Presentation(_as_file(source))
+    for slide in presentation.slides:
+        yield "".join(shape.text + "\n" for shape in slide.shapes if hasattr(shape, "text"))
+
+def read_pdf(blob_data):
+    return "".join(iter_pdf_pages(blob_data))
 
 def read_docx(blob_data):
-    with io.BytesIO(blob_data) as temp_file:
-        doc = docx.Document(temp_file)
-        text = ""
-        for para in doc.paragraphs:
-            text += para.text + "\n"
-    return text
+    return "".join(iter_docx_paragraphs(blob_data))
 
 def read_txt(blob_data):
-    with io.BytesIO(blob_data) as temp_file:
-        text = temp_file.read().decode('utf-8') 
-    return text
+    return "".join(iter_txt(blob_data))
 
 def read_pptx(blob_data):
-    with io.BytesIO(blob_data) as temp_file:
-        presentation = Presentation(temp_file)
-        text = ""
-        for slide in presentation.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + "\n"
-    return text
\ No newline at end of file
+    return "".join(iter_pptx_slides(blob_data))
+
+def spool_blob_to_tempfile(downloader, suffix=""):
+    """
+    Write a blob download to a temporary file chunk by chunk, so the whole blob is never held in memory.
+
+    Args:
+        downloader (StorageStreamDownloader): Result of BlobClient.download_blob(). Required.
+        suffix (str): Suffix of the temporary file name. Default: "".
+
+    Returns:
+        str: Path of the temporary file. The caller removes it.
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            for chunk in downloader.chunks():
+                temp_file.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+def _find_separators(separator_pattern, region, offset, scan_from, last_separator):
+    # Scans region, which starts at buffer offset `offset`, from scan_from on; returns the start of the
+    # last separator and the end of the last match
+    for match in separator_pattern.finditer(region, max(scan_from - offset, 0)):
+        last_separator, scan_from = offset + match.start(), offset + match.end()
+    return last_separator, scan_from
+
+
+def split_text_stream(text_splitter, texts, chunk_size, separator="\n\n", window=None):
+    """
+    Split a stream of pages, slides or paragraphs into chunks without building the whole document.
+    Once a window of new text is buffered, the buffer is split at its last separator; every chunk but
+    the last is emitted and the last one is carried over. Chunks keep the splitter's separator, size
+    and overlap, but near a cut they can start or end at a different separator than splitting the
+    joined text would, since the splitter packs the carried-over text afresh. Text that runs for a
+    whole window without a separator is split on its own, so the buffer stays within a few windows.
+
+    Args:
+        text_splitter (CharacterTextSplitter): Splitter configured with chunk size and overlap. Required.
+        texts (Iterable[str]): Text pieces in document order. Required.
+        chunk_size (int): Chunk size of the splitter. Required.
+        separator (str): Separator of the splitter. Default: "\\n\\n".
+        window (int): New text that triggers a split. Default: 4 x chunk size.
+
+    Returns:
+        Iterator[str]: Chunk texts.
+    """
+    window = window or chunk_size * 4
+    # Found left to right like the splitter does, so a run such as "\n\n\n" is cut at the same place
+    separator_pattern = re.compile(re.escape(separator)) if separator else None
+    # Each piece is scanned once, along with the end of the previous one for separators spanning both
+    tail_length = len(separator) - 1 if separator else 0
+    pieces, length, carried = [], 0, 0
+    last_separator, scan_from, tail = -1, 0, ""
+    for text in texts:
+        if separator_pattern is not None:
+            region = tail + text
+            last_separator, scan_from = _find_separators(
+                separator_pattern, region, length - len(tail), scan_from, last_separator
+            )
+            tail = region[max(len(region) - tail_length, 0):] if tail_length else ""
+        pieces.append(text)
+        length += len(text)
+        # Positions before the tail were all tried; only the tail may still start a separator
+        scan_from = max(scan_from, length - tail_length)
+        if length - carried < window:
+            continue
+
+        buffer = "".join(pieces)
+        if last_separator <= 0 or length - last_separator >= window:
+            # Nowhere to cut within the last window; splitting it all keeps the buffer bounded
+            yield from text_splitter.split_text(buffer)
+            pieces, length, carried = [], 0, 0
+            last_separator, scan_from, tail = -1, 0, ""
+            continue
+
+        # Text after the last separator may continue in the next piece, so it is not split yet
+        head, rest = buffer[:last_separator], buffer[last_separator:]
+        chunks = text_splitter.split_text(head)
+        yield from chunks[:-1]
+        # Chunks are stripped; put back the whitespace the last one lost at the boundary
+        carry = (chunks[-1] if chunks else "") + head[len(head.rstrip()):] + rest
+        pieces, length, carried = [carry], len(carry), len(carry)
+        last_separator, scan_from = _find_separators(separator_pattern, carry, 0, 0, -1)
+        scan_from = max(scan_from, length - tail_length)
+        tail = carry[max(length - tail_length, 0):] if tail_length else ""
+    if pieces:
+        yield from text_splitter.split_text("".join(pieces))
+
+file_readers = {
+    '.pdf': read_pdf,
+    '.docx': read_docx,
+    '.pptx': read_pptx,
+    '.txt': read_txt
+}
+
+file_iterators = {
+    '.pdf': iter_pdf_pages,
+    '.docx': iter_docx_paragraphs,
+    '.pptx': iter_pptx_slides,
+    '.txt': iter_txt
+}
@@ -1,15 +1,17 @@
 import os
-import pymongo
 from dotenv import load_dotenv
 
+from databaseservice.mongoClientRegistry import mongo_clients
+
 load_dotenv()
 
 class DatabaseService:
     """
-    DatabaseService manages a MongoDB connection pool for efficient database access.
+    DatabaseService gives access to the Cosmos DB database of the app.
 
     Features:
-    - Uses a connection pool to improve performance.
+    - Uses the pooled client of the shared MongoClientRegistry, also used by mongo_helper.
+    - Vector stores are built on collections of get_db(), so they share that pool instead of opening their own.
     - Ensures only one database connection is shared across the app.
     - Supports environment variables for configuration.
     """
@@ -31,25 +33,25 @@ class DatabaseService:
         if not self.mongo_connection_string or not self.database_name:
             raise ValueError("MongoDB connection string and database name must be set.")
 
-        self.client = pymongo.MongoClient(
-            self.mongo_connection_string,
-            maxPoolSize=20,  # Maximum number of connections in the pool
-            minPoolSize=5,   # Minimum number of idle connections
-            serverSelectionTimeoutMS=5000  # Timeout if unable to connect
-        )
-
-        self.db = self.client[self.database_name]
         print("MongoDB Connection Pool Initialized")
 
+    @property
+    def client(self):
+        """Returns the shared client of the Cosmos connection string."""
+        return mongo_clients.get_client(self.mongo_connection_string)
+
+    @property
+    def db(self):
+        return self.client[self.database_name]
+
     def get_db(self):
         """Returns the database instance."""
         return self.db
 
     def close_connection(self):
-        """Closes the MongoDB client connection."""
-        if self.client:
-            self.client.close()
-            print("MongoDB Connection Closed")
+        """Closes the Cosmos client of this process, which mongo_helper shares, at shutdown; other clients stay open."""
+        mongo_clients.close(self.mongo_connection_string)
+        print("MongoDB Connection Closed")
 
     def get_mongo_connection_string(self):
         """
@@ -0,0 +1,191 @@
+import os
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+import pymongo
+from dotenv import load_dotenv
+from pymongo.monitoring import ConnectionPoolListener
+
+load_dotenv()
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """
+    Connection pool listener counting checkouts and the time spent waiting for a connection, per server.
+    """
+
+    def __init__(self, recent=1000):
+        self._lock = threading.Lock()
+        self._recent = recent
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._servers = {}
+
+    def _server(self, address):
+        key = f"{address[0]}:{address[1]}"
+        server = self._servers.get(key)
+        if server is None:
+            server = self._servers[key] = {
+                "checkouts": 0, "checkout_failures": 0, "checked_out": 0, "max_checked_out": 0,
+                "connections_created": 0, "connections_closed": 0, "pool_clears": 0,
+                "wait_ms": deque(maxlen=self._recent),
+            }
+        return server
+
+    def _waited(self, event, server):
+        # pymongo reports how long the checkout waited; older versions do not
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            server["wait_ms"].append(duration * 1000)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server["checkouts"] += 1
+            server["checked_out"] += 1
+            server["max_checked_out"] = max(server["max_checked_out"], server["checked_out"])
+            self._waited(event, server)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server["checkout_failures"] += 1
+            self._waited(event, server)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server["checked_out"] = max(0, server["checked_out"] - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._server(event.address)["connections_created"] += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._server(event.address)["connections_closed"] += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._server(event.address)["pool_clears"] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def stats(self):
+        """
+        Returns:
+            dict: Counters and checkout wait times (average, p95 and max over recent checkouts) per server.
+        """
+        with self._lock:
+            servers = {}
+            for address, server in self._servers.items():
+                waits = sorted(server["wait_ms"])
+                servers[address] = {
+                    **{k: v for k, v in server.items() if k != "wait_ms"},
+                    "wait_ms_avg": round(sum(waits) / len(waits), 3) if waits else None,
+                    "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else None,
+                    "wait_ms_max": round(waits[-1], 3) if waits else None,
+                }
+            return servers
+
+
+class MongoClientRegistry:
+    """
+    MongoClientRegistry owns every MongoDB client of the process: one pooled client per connection string.
+
+    Features:
+    - Pool sizes and timeouts are set in one place, from environment variables.
+    - Clients connect lazily, on their first operation, so nothing is connected while the app is imported.
+    - Clients belong to the process that created them. gunicorn imports the app in each worker
+      (no --preload), so every worker builds its own; a client created before a fork must not be used after it.
+    - Checkout and wait-time metrics of every pool, through stats().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self.metrics = PoolMetrics()
+        self.pool_options = {
+            "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+            "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000)),
+            "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        }
+        # Unless set, pools keep pymongo's size (100) and requests wait for a connection without a time limit;
+        # a smaller pool would queue the dashboard's parallel per-course queries behind each other
+        if os.getenv("MONGO_MAX_POOL_SIZE"):
+            self.pool_options["maxPoolSize"] = int(os.getenv("MONGO_MAX_POOL_SIZE"))
+        if os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS"):
+            self.pool_options["waitQueueTimeoutMS"] = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS"))
+    def get_client(self, connection_string):
+        """
+        Get the shared client for a connection string, creating it on first use.
+
+        Args:
+            connection_string (str): MongoDB connection string. Required.
+
+        Returns:
+            MongoClient: Client of this process; it connects on its first operation.
+        """
+        with self._lock:
+            client = self._clients.get(connection_string)
+            if client is None:
+                client = pymongo.MongoClient(
+                    connection_string,
+                    connect=False,
+                    event_listeners=[self.metrics],
+                    **self.pool_options
+                )
+                self._clients[connection_string] = client
+            return client
+
+    def close(self, connection_string=None):
+        """
+        Close the client of a connection string; the next get_client creates a new one.
+
+        Args:
+            connection_string (str): Connection string of the client to close. Default: every client of this process.
+        """
+        with self._lock:
+            if connection_string is None:
+                clients, self._clients = list(self._clients.values()), {}
+            else:
+                client = self._clients.pop(connection_string, None)
+                clients = [client] if client is not None else []
+        for client in clients:
+            client.close()
+
+    def stats(self):
+        """
+        Get the pool settings, clients and pool metrics of this process.
+
+        Returns:
+            dict: pid, pool options, the hosts of each client and per-server pool metrics.
+        """
+        with self._lock:
+            # Hosts only; connection strings carry credentials
+            hosts = [urlsplit(uri).hostname if isinstance(uri, str) and "://" in uri else None for uri in self._clients]
+        return {
+            "pid": os.getpid(),
+            "pool_options": self.pool_options,
+            "clients": hosts,
+            "servers": self.metrics.stats(),
+        }
+
+
+mongo_clients = MongoClientRegistry()
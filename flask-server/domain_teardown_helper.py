@@ -0,0 +1,99 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_search_helper import search_clients, index_writer
+from blob_storage_helper import blob_service_client, delete_blobs_in_batches
+from ingestion_helper import delete_chunks_by_filenames, scan_chunk_ids_by_filenames
+from mongo_helper import db
+
+
+def _with_retries(step, attempts, backoff):
+    # Every step is idempotent, so a failed attempt is simply run again
+    for attempt in range(attempts):
+        try:
+            return step()
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            if attempt == attempts - 1:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+
+def teardown_domain(course_name, domain_name, filenames, attempts=3, backoff=1.0, settle_seconds=5.0):
+    """
+    Delete a domain's blobs, index chunks and file records, cleaning the three stores in parallel.
+
+    Args:
+        course_name (str): Course (container and index) name. Required.
+        domain_name (str): Domain (virtual folder) name. Required.
+        filenames (List[str]): Names of the domain's files, whose chunks are removed from the index. Required.
+        attempts (int): Attempts per store before it is reported as failed. Default: 3.
+        backoff (float): Seconds before the second attempt, doubled after each failure. Default: 1.0.
+        settle_seconds (float): Time allowed for index deletes to become visible before the check. Default: 5.0.
+
+    Returns:
+        dict: Per-store deleted and remaining counts or errors, 'consistent' and 'seconds'.
+    """
+    start_time = time.perf_counter()
+    container_client = blob_service_client.get_container_client(course_name.lower())
+    search_client = search_clients.get_search_client(course_name)
+    domain_filter = {"course_name": course_name, "domain": domain_name}
+
+    def delete_blobs():
+        blob_names = [blob.name for blob in container_client.list_blobs(name_starts_with=f"{domain_name}/")]
+        failed = delete_blobs_in_batches(container_client, blob_names)
+        if failed:
+            raise RuntimeError(f"{len(failed)} blob(s) could not be deleted: {failed[:5]}")
+        return len(blob_names)
+
+    def delete_chunks():
+        return delete_chunks_by_filenames(search_client, index_writer, filenames) if filenames else 0
+
+    def delete_records():
+        return db["uploaded_files"].delete_many(domain_filter).deleted_count
+
+    def remaining_blobs():
+        return sum(1 for _ in container_client.list_blobs(name_starts_with=f"{domain_name}/"))
+
+    def remaining_chunks():
+        if not filenames:
+            return 0
+        # Deletes reach search results after a short delay, so the check waits for them to settle
+        deadline = time.monotonic() + settle_seconds
+        while True:
+            # Batched like the delete, so a domain with many files does not build one huge filter
+            remaining = sum(1 for _ in scan_chunk_ids_by_filenames(search_client, list(dict.fromkeys(filenames))))
+            if remaining == 0 or time.monotonic() >= deadline:
+                return remaining
+            time.sleep(1)
+
+    def remaining_records():
+        return db["uploaded_files"].count_documents(domain_filter)
+
+    stores = {
+        "blobs": (delete_blobs, remaining_blobs),
+        "index": (delete_chunks, remaining_chunks),
+        "mongo": (delete_records, remaining_records),
+    }
+
+    def clean(name):
+        delete, remaining = stores[name]
+        entry = {}
+        try:
+            entry["deleted"] = _with_retries(delete, attempts, backoff)
+        except Exception as e:
+            entry["error"] = str(e)
+        try:
+            entry["remaining"] = remaining()
+        except Exception as e:
+            entry["remaining"] = None
+            entry.setdefault("error", str(e))
+        return name, entry
+
+    with ThreadPoolExecutor(max_workers=len(stores)) as executor:
+        report = dict(executor.map(clean, stores))
+
+    report["consistent"] = all(entry.get("remaining") == 0 and "error" not in entry for entry in report.values())
+    report["seconds"] = round(time.perf_counter() - start_time, 3)
+    print(f"Domain teardown of {course_name}/{domain_name}: {report}")
+    return report
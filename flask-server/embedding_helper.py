@@ -0,0 +1,563 @@
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import tiktoken
+from langchain_core.embeddings import Embeddings
+
+_encoding = None
+
+
+def count_tokens(texts):
+    """
+    Count the tokens billed for a list of texts (cl100k_base, used by the ada-002 and v3 embedding models).
+
+    Args:
+        texts (List[str]): Texts sent to the embedding endpoint. Required.
+
+    Returns:
+        int: Total number of tokens.
+    """
+    return sum(token_counts(texts))
+
+
+def token_counts(texts):
+    """
+    Count the tokens of each text (cl100k_base).
+
+    Args:
+        texts (List[str]): Texts to count. Required.
+
+    Returns:
+        List[int]: Number of tokens per text.
+    """
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return [len(tokens) for tokens in _encoding.encode_ordinary_batch(list(texts))]
+
+
+def normalize_chunk_text(text: str):
+    """
+    Normalise chunk text so that whitespace-only edits map to the same cache entry.
+
+    Args:
+        text (str): Chunk text. Required.
+
+    Returns:
+        str: Text with runs of whitespace collapsed to single spaces.
+    """
+    return " ".join(text.split())
+
+
+def chunk_hash(text: str, model: str):
+    """
+    Hash of the normalised chunk text and the embedding model name.
+
+    Args:
+        text (str): Chunk text. Required.
+        model (str): Embedding model / deployment name. Required.
+
+    Returns:
+        str: Hex encoded SHA-256 digest.
+    """
+    payload = f"{model}\x00{normalize_chunk_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class EmbeddingUsage:
+    """
+    Thread-safe counters of the embedding work done for one ingestion.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.texts = 0
+        self.tokens = 0
+        self.cache_hits = 0
+
+    def record_call(self, texts):
+        tokens = count_tokens(texts)
+        with self._lock:
+            self.calls += 1
+            self.texts += len(texts)
+            self.tokens += tokens
+
+    def record_cache_hits(self, count: int):
+        with self._lock:
+            self.cache_hits += count
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "texts": self.texts,
+                "tokens": self.tokens,
+                "cache_hits": self.cache_hits
+            }
+
+
+class EmbeddingCache:
+    """
+    Size-bounded LRU cache of chunk embeddings, persisted in a local SQLite file.
+    The file is shared by every gunicorn worker on the host.
+
+    Args:
+        path (str): Path of the SQLite file. Required.
+        max_entries (int): Entries kept before the least recently used are evicted. Default: 50000.
+    """
+
+    # SQLite caps the number of bound parameters per statement.
+    _BATCH = 500
+
+    def __init__(self, path: str, max_entries: int = 50000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, keys):
+        """
+        Look up embeddings and mark the hits as recently used.
+
+        Args:
+            keys (Iterable[str]): Cache keys from chunk_hash. Required.
+
+        Returns:
+            Dict[str, List[float]]: Embeddings of the keys that were found.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock, self._connect() as conn:
+            for start in range(0, len(keys), self._BATCH):
+                batch = keys[start:start + self._BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                if rows:
+                    hit_keys = [key for key, _ in rows]
+                    conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(hit_keys))})",
+                        [time.time(), *hit_keys]
+                    )
+        return found
+
+    def put_many(self, items):
+        """
+        Store embeddings and evict the least recently used entries beyond max_entries.
+
+        Args:
+            items (Dict[str, List[float]]): Embeddings keyed by chunk_hash. Required.
+        """
+        if not items:
+            return
+        now = time.time()
+        # Azure AI Search stores vectors as Edm.Single, so float32 loses nothing.
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends chunks missing from the cache to the embedding endpoint.
+
+    Args:
+        embeddings (Embeddings): Underlying embeddings client. Required.
+        model (str): Embedding model name, part of the cache key. Required.
+        cache (EmbeddingCache): Chunk embedding cache. Required.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts, usage: EmbeddingUsage = None):
+        keys = [chunk_hash(text, self.model) for text in texts]
+        try:
+            found = self.cache.get_many(keys)
+        except sqlite3.Error as e:
+            print(f"Embedding cache lookup failed: {e}")
+            found = {}
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if usage is not None:
+            usage.record_cache_hits(len(texts) - sum(1 for key in keys if key in missing))
+
+        if missing:
+            if usage is not None:
+                usage.record_call(list(missing.values()))
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            found.update(fresh)
+            try:
+                self.cache.put_many(fresh)
+            except sqlite3.Error as e:
+                print(f"Embedding cache write failed: {e}")
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+class RateLimiter:
+    """
+    Sliding one-minute window limiting requests and tokens sent to the embedding endpoint.
+    A limit of 0 disables that check.
+
+    Args:
+        requests_per_minute (int): Maximum requests per minute. Default: 0.
+        tokens_per_minute (int): Maximum tokens per minute. Default: 0.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._events = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        """
+        Block until a request of the given size fits in the current window.
+
+        Args:
+            tokens (int): Tokens in the request. Required.
+        """
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= 60:
+                    self._events.popleft()
+                used = sum(count for _, count in self._events)
+                requests_ok = not self.requests_per_minute or len(self._events) < self.requests_per_minute
+                # An oversized request is still let through once the window is empty
+                tokens_ok = not self.tokens_per_minute or not self._events or used + tokens <= self.tokens_per_minute
+                if requests_ok and tokens_ok:
+                    self._events.append((now, tokens))
+                    return
+                wait = 60 - (now - self._events[0][0])
+            time.sleep(max(wait, 0.01))
+
+
+class _PendingTexts:
+    def __init__(self, texts, counts, future):
+        self.texts = texts
+        self.counts = counts
+        self.future = future
+        self.vectors = [None] * len(texts)
+        self.remaining = len(texts)
+
+
+class EmbeddingBatcher(Embeddings):
+    """
+    Packs texts submitted by many callers into embedding requests bounded by a token budget and
+    an input count, sends them under a rate limit, and scatters the vectors back to each caller.
+    Small files share a request; large files are spread over several.
+
+    Args:
+        embeddings (Embeddings): Underlying embeddings client. Required.
+        max_tokens (int): Token budget of one request. Default: 100000.
+        max_texts (int): Maximum inputs in one request. Default: 1024.
+        linger (float): Seconds to wait for more texts before sending a partial request. Default: 0.05.
+        max_concurrency (int): Requests in flight at once. Default: 4.
+        rate_limiter (RateLimiter): Limits applied before each request. Default: no limit.
+    """
+
+    def __init__(
+            self,
+            embeddings: Embeddings,
+            max_tokens: int = 100000,
+            max_texts: int = 1024,
+            linger: float = 0.05,
+            max_concurrency: int = 4,
+            rate_limiter: RateLimiter = None
+    ):
+        self.embeddings = embeddings
+        self.max_tokens = max_tokens
+        self.max_texts = max_texts
+        self.linger = linger
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = rate_limiter or RateLimiter()
+
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_tokens = 0
+        self._pending_texts = 0
+        self._pid = None
+        self._executor = None
+
+        self.requests = 0
+        self.texts = 0
+        self.tokens = 0
+
+    def submit(self, texts):
+        """
+        Queue texts for embedding.
+
+        Args:
+            texts (List[str]): Texts of one caller. Required.
+
+        Returns:
+            Future: Resolves to the list of vectors, in the order of texts.
+        """
+        future = Future()
+        texts = list(texts)
+        if not texts:
+            future.set_result([])
+            return future
+        counts = token_counts(texts)
+        with self._cond:
+            self._ensure_started()
+            self._pending.append(_PendingTexts(texts, counts, future))
+            self._pending_tokens += sum(counts)
+            self._pending_texts += len(texts)
+            self._cond.notify()
+        return future
+
+    def embed_documents(self, texts):
+        return self.submit(texts).result()
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "texts": self.texts, "tokens": self.tokens}
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.linger
+                while self._pending_tokens < self.max_tokens and self._pending_texts < self.max_texts:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                entries = self._pending
+                self._pending = []
+                self._pending_tokens = 0
+                self._pending_texts = 0
+
+            # A failure fails the callers whose texts were not sent; the loop keeps serving the others
+            unsent = None
+            try:
+                unsent = self._pack(entries)
+                while unsent:
+                    slots, tokens = unsent[0]
+                    self.rate_limiter.acquire(tokens)
+                    self._executor.submit(self._send, slots, tokens)
+                    unsent.pop(0)
+            except Exception as e:
+                print(f"Failed to send embedding requests: {e}")
+                if unsent is None:
+                    self._fail([(entry, None, None) for entry in entries], e)
+                else:
+                    self._fail([slot for slots, _ in unsent for slot in slots], e)
+
+    def _pack(self, entries):
+        requests, current, current_tokens = [], [], 0
+        for entry in entries:
+            for index, (text, count) in enumerate(zip(entry.texts, entry.counts)):
+                if current and (current_tokens + count > self.max_tokens or len(current) >= self.max_texts):
+                    requests.append((current, current_tokens))
+                    current, current_tokens = [], 0
+                current.append((entry, index, text))
+                current_tokens += count
+        if current:
+            requests.append((current, current_tokens))
+        return requests
+
+    def _fail(self, slots, e):
+        with self._lock:
+            for entry, _, _ in slots:
+                if not entry.future.done():
+                    entry.future.set_exception(e)
+
+    def _send(self, slots, tokens):
+        try:
+            vectors = self.embeddings.embed_documents([text for _, _, text in slots])
+        except Exception as e:
+            self._fail(slots, e)
+            return
+
+        with self._lock:
+            self.requests += 1
+            self.texts += len(slots)
+            self.tokens += tokens
+            for (entry, index, _), vector in zip(slots, vectors):
+                entry.vectors[index] = vector
+                entry.remaining -= 1
+                if entry.remaining == 0 and not entry.future.done():
+                    entry.future.set_result(entry.vectors)
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def _batcher_key(model, embeddings):
+    # Clients of the same model may still call different deployments, endpoints or API versions
+    return (
+        model,
+        getattr(embeddings, "deployment", None),
+        getattr(embeddings, "azure_endpoint", None),
+        getattr(embeddings, "openai_api_version", None),
+    )
+
+
+def get_embedding_batcher(model: str, embeddings: Embeddings):
+    """
+    Return the process-wide batcher for an embedding model and client configuration (deployment,
+    endpoint and API version), creating it around the given client on first use. Limits come from
+    EMBEDDING_BATCH_MAX_TOKENS, EMBEDDING_BATCH_MAX_TEXTS, EMBEDDING_BATCH_LINGER_MS,
+    EMBEDDING_MAX_CONCURRENCY, EMBEDDING_RPM and EMBEDDING_TPM, and apply to each batcher.
+
+    Args:
+        model (str): Embedding model / deployment name. Required.
+        embeddings (Embeddings): Client used if no batcher exists for its configuration yet. Required.
+
+    Returns:
+        EmbeddingBatcher: Shared batcher.
+    """
+    key = _batcher_key(model, embeddings)
+    with _batchers_lock:
+        if key not in _batchers:
+            _batchers[key] = EmbeddingBatcher(
+                embeddings,
+                max_tokens=int(os.environ.get("EMBEDDING_BATCH_MAX_TOKENS", 100000)),
+                max_texts=int(os.environ.get("EMBEDDING_BATCH_MAX_TEXTS", 1024)),
+                linger=int(os.environ.get("EMBEDDING_BATCH_LINGER_MS", 50)) / 1000,
+                max_concurrency=int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", 4)),
+                rate_limiter=RateLimiter(
+                    requests_per_minute=int(os.environ.get("EMBEDDING_RPM", 0)),
+                    tokens_per_minute=int(os.environ.get("EMBEDDING_TPM", 0))
+                )
+            )
+        return _batchers[key]
+
+
+# Output dimensions of the Azure OpenAI embedding models, so indexes can be created without a probe call
+KNOWN_EMBEDDING_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+
+class EmbeddingDimensions:
+    """
+    Resolves the vector dimension of an embedding deployment on first use instead of at import.
+    Dimensions come from EMBEDDING_DIMENSIONS ("deployment=dim,..."), then the known models, then
+    a JSON file of earlier answers; only an unknown deployment costs one probe embedding, whose
+    result is written to the file for every later process.
+
+    Args:
+        path (str): Path of the JSON file of probed dimensions. Required.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dimensions = dict(KNOWN_EMBEDDING_DIMENSIONS)
+        for entry in filter(None, os.environ.get("EMBEDDING_DIMENSIONS", "").split(",")):
+            model, _, dimension = entry.partition("=")
+            self._dimensions[model.strip()] = int(dimension)
+        self._loaded = False
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as dimensions_file:
+                for model, dimension in json.load(dimensions_file).items():
+                    self._dimensions.setdefault(model, int(dimension))
+        except (OSError, ValueError):
+            pass
+        self._loaded = True
+
+    def _save(self, model, dimension):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.path, encoding="utf-8") as dimensions_file:
+                saved = json.load(dimensions_file)
+        except (OSError, ValueError):
+            saved = {}
+        saved[model] = dimension
+        # Written to a temporary file first so other workers never read half a file
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as dimensions_file:
+            json.dump(saved, dimensions_file)
+        os.replace(temp_path, self.path)
+
+    def get(self, model: str, embeddings: Embeddings):
+        """
+        Args:
+            model (str): Embedding model / deployment name. Required.
+            embeddings (Embeddings): Client used to probe a deployment of unknown dimension. Required.
+
+        Returns:
+            int: Length of the vectors the deployment returns.
+        """
+        with self._lock:
+            if model not in self._dimensions and not self._loaded:
+                self._load()
+            if model in self._dimensions:
+                return self._dimensions[model]
+            dimension = len(embeddings.embed_query("Embeddings dimension finder"))
+            self._dimensions[model] = dimension
+            try:
+                self._save(model, dimension)
+            except OSError as e:
+                print(f"Could not cache the dimension of {model}: {e}")
+            return dimension
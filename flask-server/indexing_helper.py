@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from azure.core.exceptions import HttpResponseError
+
+# Per-document status codes Azure AI Search documents as transient
+RETRYABLE_STATUS_CODES = {409, 422, 429, 503}
+
+
+class IndexingError(Exception):
+    """Raised when some documents could not be indexed after every retry."""
+
+    def __init__(self, failed):
+        self.failed = failed
+        keys = ", ".join(str(key) for key, _ in failed[:5])
+        more = f" and {len(failed) - 5} more" if len(failed) > 5 else ""
+        super().__init__(f"{len(failed)} document(s) failed to index: {keys}{more}")
+
+
+def payload_size(document):
+    """Approximate JSON size of one index action in bytes."""
+    return len(json.dumps(document, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+
+def split_batches(documents, max_bytes, max_actions):
+    """
+    Group documents into batches that stay under a payload size and an action count.
+
+    Args:
+        documents (List[dict]): Documents of one action type. Required.
+        max_bytes (int): Payload bytes per batch. A larger document still gets a batch of its own. Required.
+        max_actions (int): Documents per batch. Required.
+
+    Returns:
+        List[List[dict]]: Batches in input order.
+    """
+    batches, batch, batch_bytes = [], [], 0
+    for document in documents:
+        size = payload_size(document)
+        if batch and (batch_bytes + size > max_bytes or len(batch) >= max_actions):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(document)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class IndexWriter:
+    """
+    Sends upload, merge and delete actions to Azure AI Search in payload-sized batches with bounded
+    concurrency. Documents that fail with a transient status are retried by key; a batch rejected as
+    too large is halved, and the batch size limit shrinks until writes go through again.
+
+    Args:
+        max_batch_bytes (int): Payload bytes per request. Default: 8 MiB (the service limit is 16 MB).
+        max_batch_actions (int): Documents per request. Default: 1000 (the service limit).
+        max_concurrency (int): Requests in flight per process. Default: 4.
+        max_retries (int): Retries of failed keys or throttled requests. Default: 3.
+        retry_backoff (float): Seconds before the first retry, doubled on every retry. Default: 1.0.
+        key_field (str): Key field of the index. Default: 'id'.
+    """
+
+    def __init__(self, max_batch_bytes: int = 8 * 1024 * 1024, max_batch_actions: int = 1000,
+                 max_concurrency: int = 4, max_retries: int = 3, retry_backoff: float = 1.0, key_field: str = 'id'):
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_actions = max_batch_actions
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.key_field = key_field
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._batch_bytes_limit = max_batch_bytes
+        self._totals = {"batches": 0, "documents": 0, "bytes": 0, "seconds": 0.0, "retried": 0, "failed": 0, "too_large": 0}
+        self._recent = deque(maxlen=100)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+            return self._executor
+
+    def _send(self, search_client, action, batch):
+        send = getattr(search_client, f"{action}_documents")
+        size = sum(payload_size(document) for document in batch)
+        start_time = time.perf_counter()
+        results = send(documents=batch)
+        elapsed = time.perf_counter() - start_time
+        with self._lock:
+            self._totals["batches"] += 1
+            self._totals["documents"] += len(batch)
+            self._totals["bytes"] += size
+            self._totals["seconds"] += elapsed
+            self._recent.append({
+                "action": action,
+                "documents": len(batch),
+                "bytes": size,
+                "seconds": round(elapsed, 4),
+                "documents_per_second": round(len(batch) / elapsed, 1) if elapsed else None
+            })
+        return results
+
+    def _write_batch(self, search_client, action, batch):
+        # Returns [(key, error)] for documents that are still failing after the last retry
+        pending, failed = batch, []
+        for attempt in range(self.max_retries + 1):
+            try:
+                results = self._send(search_client, action, pending)
+            except HttpResponseError as e:
+                if e.status_code == 413 and len(pending) > 1:
+                    with self._lock:
+                        self._totals["too_large"] += 1
+                        self._batch_bytes_limit = max(self._batch_bytes_limit // 2, 64 * 1024)
+                    middle = len(pending) // 2
+                    halves = (self._write_batch(search_client, action, pending[:middle])
+                              + self._write_batch(search_client, action, pending[middle:]))
+                    with self._lock:
+                        self._totals["failed"] += len(failed)
+                    return failed + halves
+                if e.status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                    failed += [(document[self.key_field], str(e)) for document in pending]
+                    break
+                retry = pending
+            else:
+                by_key = {document[self.key_field]: document for document in pending}
+                retry = []
+                for result in results:
+                    if result.succeeded:
+                        continue
+                    if result.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                        retry.append(by_key[result.key])
+                    else:
+                        failed.append((result.key, result.error_message or f"status {result.status_code}"))
+                if not retry:
+                    break
+
+            with self._lock:
+                self._totals["retried"] += len(retry)
+            time.sleep(self.retry_backoff * (2 ** attempt))
+            pending = retry
+
+        with self._lock:
+            self._totals["failed"] += len(failed)
+        return failed
+
+    def write(self, search_client, action: str, documents):
+        """
+        Index documents of one action type and wait for every batch.
+
+        Args:
+            search_client (SearchClient): Client of the target index. Required.
+            action (str): 'upload', 'merge' or 'delete'. Required.
+            documents (List[dict]): Documents, each carrying the key field. Required.
+
+        Returns:
+            int: Documents indexed.
+
+        Raises:
+            IndexingError: If any document still failed after its retries.
+        """
+        if not documents:
+            return 0
+        with self._lock:
+            batch_bytes_limit, too_large = self._batch_bytes_limit, self._totals["too_large"]
+        batches = split_batches(documents, batch_bytes_limit, self.max_batch_actions)
+        executor = self._get_executor()
+        futures = [executor.submit(self._write_batch, search_client, action, batch) for batch in batches]
+        failed = [failure for future in futures for failure in future.result()]
+        # A shrunken limit grows back once writes stop being rejected as too large
+        with self._lock:
+            if self._totals["too_large"] == too_large:
+                self._batch_bytes_limit = min(int(self._batch_bytes_limit * 1.25), self.max_batch_bytes)
+        if failed:
+            raise IndexingError(failed)
+        return len(documents)
+
+    def apply(self, search_client, merge_actions=None, upload_actions=None, delete_actions=None):
+        """
+        Index the actions planned for a file.
+
+        Returns:
+            int: Documents indexed.
+        """
+        return (self.write(search_client, 'merge', merge_actions or [])
+                + self.write(search_client, 'upload', upload_actions or [])
+                + self.write(search_client, 'delete', delete_actions or []))
+
+    def stats(self):
+        """
+        Returns:
+            dict: Totals, throughput, the current batch size limit and the most recent batches.
+        """
+        with self._lock:
+            totals = dict(self._totals)
+            recent = list(self._recent)
+            batch_bytes_limit = self._batch_bytes_limit
+        seconds = totals["seconds"]
+        return {
+            **totals,
+            "batch_bytes_limit": batch_bytes_limit,
+            "documents_per_second": round(totals["documents"] / seconds, 1) if seconds else None,
+            "mean_batch_seconds": round(seconds / totals["batches"], 4) if totals["batches"] else None,
+            "recent_batches": recent
+        }
@@ -0,0 +1,279 @@
+import queue
+import threading
+import uuid
+
+from embedding_helper import chunk_hash
+
+# Results a single key scan may return; the service caps offset paging at 100000
+SCAN_MAX_RESULTS = 100000
+
+
+class ScanLimitError(Exception):
+    """Raised when a key scan matches more chunks than one scan can return."""
+
+    def __init__(self, filter, count):
+        self.filter = filter
+        self.count = count
+        super().__init__(f"{count} chunks match, more than the {SCAN_MAX_RESULTS} one scan returns: {filter[:200]}")
+
+
+def filename_filter(filename):
+    # OData string literals escape single quotes by doubling them
+    escaped = filename.replace("'", "''")
+    return f"filename eq '{escaped}'"
+
+
+def filenames_filter(filenames):
+    """
+    Build one filter matching the chunks of any of the given files.
+
+    Args:
+        filenames (List[str]): File names. Required.
+
+    Returns:
+        str: OData filter.
+    """
+    if any('|' in filename for filename in filenames):
+        return " or ".join(f"({filename_filter(filename)})" for filename in filenames)
+    # search.in takes the values as one delimited string literal
+    values = "|".join(filenames).replace("'", "''")
+    return f"search.in(filename, '{values}', '|')"
+
+
+def scan_chunk_ids(search_client, filter):
+    """
+    Yield the ids of every chunk matching a filter, fetching only the key field. A large top makes the
+    service return pages of 1000 keys rather than its default of 50 documents.
+
+    Args:
+        search_client (SearchClient): Client of the course index. Required.
+        filter (str): OData filter, e.g. from filename_filter or filenames_filter. Required.
+
+    Returns:
+        Iterator[str]: Chunk ids.
+
+    Raises:
+        ScanLimitError: More than SCAN_MAX_RESULTS chunks match, so some ids could not be returned.
+    """
+    results = search_client.search(
+        search_text="*", filter=filter, select=['id'], top=SCAN_MAX_RESULTS, include_total_count=True
+    )
+    count = results.get_count()
+    if count is not None and count > SCAN_MAX_RESULTS:
+        raise ScanLimitError(filter, count)
+    for result in results:
+        yield result['id']
+
+
+def scan_chunk_ids_by_filenames(search_client, filenames, filenames_per_query=500):
+    """
+    Yield the ids of every chunk of the given files, querying a batch of file names at a time.
+    A batch matching more chunks than one scan returns is split in halves until each half fits.
+
+    Args:
+        search_client (SearchClient): Client of the course index. Required.
+        filenames (List[str]): Names of the files. Required.
+        filenames_per_query (int): File names per filter, keeping each query small. Default: 500.
+
+    Returns:
+        Iterator[str]: Chunk ids.
+
+    Raises:
+        ScanLimitError: A single file has more than SCAN_MAX_RESULTS chunks.
+    """
+    batches = [filenames[start:start + filenames_per_query] for start in range(0, len(filenames), filenames_per_query)]
+    while batches:
+        batch = batches.pop(0)
+        try:
+            # Collected before yielding, so a split batch yields no id twice
+            chunk_ids = list(scan_chunk_ids(search_client, filenames_filter(batch)))
+        except ScanLimitError:
+            if len(batch) == 1:
+                raise
+            middle = len(batch) // 2
+            batches[:0] = [batch[:middle], batch[middle:]]
+            continue
+        yield from chunk_ids
+
+
+def delete_chunks_by_filenames(search_client, index_writer, filenames, filenames_per_query=500):
+    """
+    Delete the chunks of many files with a few key scans and batched delete requests.
+
+    Keys are collected before anything is deleted: the service pages results by offset, so deleting
+    mid-scan would shift later pages and skip keys.
+
+    Args:
+        search_client (SearchClient): Client of the course index. Required.
+        index_writer (IndexWriter): Writer that sends the delete batches. Required.
+        filenames (Iterable[str]): Names of the files. Required.
+        filenames_per_query (int): File names per filter, keeping each query small. Default: 500.
+
+    Returns:
+        int: Chunks deleted.
+    """
+    filenames = list(dict.fromkeys(filenames))
+    chunk_ids = list(scan_chunk_ids_by_filenames(search_client, filenames, filenames_per_query))
+    return index_writer.write(search_client, 'delete', [{'id': chunk_id} for chunk_id in dict.fromkeys(chunk_ids)])
+
+
+def diff_chunks(existing_chunks, split_docs, model):
+    """
+    Match a file's new split against the chunks already in the index by content hash,
+    so unchanged chunks keep their id and vector regardless of where they moved.
+
+    Args:
+        existing_chunks (List[dict]): Indexed chunks of the file, with 'id' and 'content'. Required.
+        split_docs (List[Document]): New chunks of the file. Required.
+        model (str): Embedding model name used for hashing. Required.
+
+    Returns:
+        Tuple: (kept ids, [(reused id, Document)] to merge, [Document] to add, [id] to delete)
+    """
+    stored = {}
+    for chunk in existing_chunks:
+        stored.setdefault(chunk_hash(chunk['content'], model), []).append(chunk['id'])
+
+    kept_ids, changed_docs = [], []
+    for sdoc in split_docs:
+        ids = stored.get(chunk_hash(sdoc.page_content, model))
+        if ids:
+            kept_ids.append(ids.pop())
+        else:
+            changed_docs.append(sdoc)
+
+    # Changed chunks take over the ids of stale chunks before new ids are minted
+    stale_ids = [chunk_id for ids in stored.values() for chunk_id in ids]
+    to_merge = list(zip(stale_ids, changed_docs))
+    to_add = changed_docs[len(stale_ids):]
+    to_delete = stale_ids[len(changed_docs):]
+    return kept_ids, to_merge, to_add, to_delete
+
+
+def plan_file_update(search_client, embeddings, filename, split_docs, usage=None):
+    """
+    Work out the index actions for one file with a single embedding pass over its changed chunks.
+
+    Args:
+        search_client (SearchClient): Client of the course index. Required.
+        embeddings (CachedEmbeddings): Embeddings used for the changed chunks. Required.
+        filename (str): Name of the file the chunks belong to. Required.
+        split_docs (List[Document]): New chunks of the file. Required.
+        usage (EmbeddingUsage): Counters for the current ingestion. Default: None.
+
+    Returns:
+        Tuple: (merge actions, upload actions, delete actions, chunk counts)
+    """
+    existing_chunks = list(search_client.search(filter=filename_filter(filename), select=['id', 'content']))
+    kept_ids, to_merge, to_add, to_delete = diff_chunks(existing_chunks, split_docs, embeddings.model)
+
+    changed_docs = [sdoc for _, sdoc in to_merge] + to_add
+    vectors = embeddings.embed_documents([sdoc.page_content for sdoc in changed_docs], usage=usage) if changed_docs else []
+
+    merge_actions = [
+        {
+            'id': chunk_id,
+            'content': sdoc.page_content,
+            'content_vector': vectors[i],
+            'filename': filename
+        } for i, (chunk_id, sdoc) in enumerate(to_merge)
+    ]
+    add_actions = [
+        {
+            'id': str(uuid.uuid4()),
+            'content': sdoc.page_content,
+            'content_vector': vectors[len(to_merge) + i],
+            'filename': filename
+        } for i, sdoc in enumerate(to_add)
+    ]
+    delete_actions = [{'id': chunk_id} for chunk_id in to_delete]
+
+    counts = {
+        'kept': len(kept_ids),
+        'merged': len(to_merge),
+        'added': len(to_add),
+        'removed': len(to_delete)
+    }
+    return merge_actions, add_actions, delete_actions, counts
+
+
+class IngestionPipeline:
+    """
+    Runs items through a sequence of stages connected by bounded queues. Every stage has its own
+    worker threads, so a slow stage (e.g. embedding) overlaps with the others across files, and
+    the number of items in flight is capped by the queue size rather than by the input size.
+
+    Args:
+        stages (List[Tuple[str, Callable, int]]): (name, function, worker count) per stage. Each function
+            takes the item produced by the previous stage and returns the item for the next one. Required.
+        queue_size (int): Capacity of each queue between stages. Default: 8.
+    """
+
+    _DONE = object()
+
+    def __init__(self, stages, queue_size: int = 8):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items):
+        """
+        Feed items through every stage and wait for them to drain.
+
+        Args:
+            items (Iterable[dict]): Work items, consumed lazily. Each should carry a 'filename'. Required.
+
+        Returns:
+            Tuple: (outputs of the last stage, [(filename, stage name, exception)] for failed items)
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results, errors = [], []
+        lock = threading.Lock()
+        remaining = [workers for _, _, workers in self.stages]
+
+        def feed():
+            try:
+                for item in items:
+                    queues[0].put(item)
+            except Exception as e:
+                with lock:
+                    errors.append((None, 'list', e))
+            finally:
+                for _ in range(self.stages[0][2]):
+                    queues[0].put(self._DONE)
+
+        def work(index):
+            name, fn, _ = self.stages[index]
+            is_last = index == len(self.stages) - 1
+            while True:
+                item = queues[index].get()
+                if item is self._DONE:
+                    break
+                try:
+                    output = fn(item)
+                except Exception as e:
+                    print(f"Ingestion stage '{name}' failed for {item.get('filename')}: {e}")
+                    with lock:
+                        errors.append((item.get('filename'), name, e))
+                    continue
+                if is_last:
+                    with lock:
+                        results.append(output)
+                else:
+                    queues[index + 1].put(output)
+
+            # The last worker of a stage to finish closes the next stage
+            with lock:
+                remaining[index] -= 1
+                closing = remaining[index] == 0
+            if closing and not is_last:
+                for _ in range(self.stages[index + 1][2]):
+                    queues[index + 1].put(self._DONE)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for index, (_, _, workers) in enumerate(self.stages):
+            threads += [threading.Thread(target=work, args=(index,), daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
@@ -0,0 +1,240 @@
+import copy
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Per-file stages, in the order they are reached
+FILE_STAGES = ["queued", "parsed", "chunked", "embedded", "indexed"]
+
+
+# Stored as dates, so the TTL index can expire finished jobs, and returned as ISO strings
+TIMESTAMP_FIELDS = ("created_at", "updated_at", "finished_at", "expires_at")
+
+
+def _now():
+    # Mongo keeps milliseconds; truncating here keeps local and Mongo jobs alike
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def _format_timestamps(job):
+    for field in TIMESTAMP_FIELDS:
+        if isinstance(job.get(field), datetime):
+            job[field] = job[field].isoformat(timespec="milliseconds") + "Z"
+    return job
+
+
+class LocalJobStore:
+    """
+    In-process job store. Only the worker that ran a job can report on it, so it is meant for
+    tests and local runs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job["_id"]] = copy.deepcopy(job)
+
+    def set_status(self, job_id, status, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields, status=status, updated_at=_now())
+
+    def set_file_stage(self, job_id, filename, stage, error=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            entry = next((f for f in job["files"] if f["name"] == filename), None)
+            if entry is None:
+                entry = {"name": filename}
+                job["files"].append(entry)
+            entry["stage"] = stage
+            if error:
+                entry["error"] = error
+            job["updated_at"] = _now()
+
+    def touch(self, job_id):
+        with self._lock:
+            self._jobs[job_id]["updated_at"] = _now()
+
+    def mark_stale(self, job_id, status, updated_at, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != status or job["updated_at"] != updated_at:
+                return False
+            job.update(fields, status="failed", updated_at=_now())
+            return True
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job.get("expires_at") and job["expires_at"] <= datetime.utcnow():
+                del self._jobs[job_id]
+                return None
+            return copy.deepcopy(job) if job else None
+
+
+class MongoJobStore:
+    """
+    Job store backed by a Mongo collection, so every gunicorn worker can report on every job.
+    Finished jobs are removed by the TTL index on 'expires_at'.
+
+    Args:
+        collection (Collection): Collection holding one document per job. Required.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def create(self, job):
+        self.collection.insert_one(job)
+
+    def set_status(self, job_id, status, **fields):
+        self.collection.update_one({"_id": job_id}, {"$set": {**fields, "status": status, "updated_at": _now()}})
+
+    def set_file_stage(self, job_id, filename, stage, error=None):
+        # File names contain dots, so files are kept in an array rather than keyed by name
+        update = {"files.$.stage": stage, "updated_at": _now()}
+        if error:
+            update["files.$.error"] = error
+        result = self.collection.update_one({"_id": job_id, "files.name": filename}, {"$set": update})
+        if result.matched_count == 0:
+            entry = {"name": filename, "stage": stage}
+            if error:
+                entry["error"] = error
+            self.collection.update_one({"_id": job_id}, {"$push": {"files": entry}, "$set": {"updated_at": _now()}})
+
+    def touch(self, job_id):
+        self.collection.update_one({"_id": job_id}, {"$set": {"updated_at": _now()}})
+
+    def mark_stale(self, job_id, status, updated_at, **fields):
+        # Only if no heartbeat or progress arrived since the job was read
+        result = self.collection.update_one(
+            {"_id": job_id, "status": status, "updated_at": updated_at},
+            {"$set": {**fields, "status": "failed", "updated_at": _now()}}
+        )
+        return result.modified_count == 1
+
+    def get(self, job_id):
+        return self.collection.find_one({"_id": job_id})
+
+
+class IngestionJobManager:
+    """
+    Runs ingestion functions on a background thread pool and records their progress in a job store.
+    The updated_at of every queued or running job of this process is refreshed each heartbeat; a job
+    whose worker died stops being refreshed and is reported as failed once it is stale_seconds old.
+
+    Args:
+        store (LocalJobStore | MongoJobStore): Where job state is kept. Required.
+        max_workers (int): Jobs run at once in this process. Default: 2.
+        heartbeat_seconds (float): Interval between updates of queued and running jobs. Default: 30.
+        stale_seconds (float): Age of the last update after which a queued or running job is failed. Default: 300.
+        retention_seconds (float): How long finished jobs are kept. Default: 7 days.
+    """
+
+    def __init__(self, store, max_workers: int = 2, heartbeat_seconds: float = 30, stale_seconds: float = 300,
+                 retention_seconds: float = 7 * 86400):
+        self.store = store
+        self.max_workers = max_workers
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        # Jobs of this process that are queued or running
+        self._active = set()
+        self._heartbeat_started = False
+
+    def submit(self, kind: str, fn, params: dict):
+        """
+        Queue an ingestion and return immediately.
+
+        Args:
+            kind (str): Job type, e.g. 'vectorstore'. Required.
+            fn (Callable): Called with **params and progress=callback(filename, stage, error=None).
+                A dict result marks the job completed; anything else marks it failed. Required.
+            params (dict): Keyword arguments of fn, stored with the job. Required.
+
+        Returns:
+            str: Job id.
+        """
+        job_id = uuid.uuid4().hex
+        created_at = _now()
+        self.store.create({
+            "_id": job_id,
+            "kind": kind,
+            "params": params,
+            "status": "queued",
+            "files": [],
+            "created_at": created_at,
+            "updated_at": created_at
+        })
+        with self._lock:
+            self._active.add(job_id)
+            if not self._heartbeat_started:
+                self._heartbeat_started = True
+                threading.Thread(target=self._heartbeat, daemon=True).start()
+        self._executor.submit(self._run, job_id, fn, params)
+        return job_id
+
+    def _finished(self):
+        finished_at = _now()
+        return {"finished_at": finished_at, "expires_at": finished_at + timedelta(seconds=self.retention_seconds)}
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            with self._lock:
+                job_ids = list(self._active)
+            for job_id in job_ids:
+                try:
+                    self.store.touch(job_id)
+                except Exception as e:
+                    print(f"Failed to record heartbeat of job {job_id}: {e}")
+
+    def _run(self, job_id, fn, params):
+        self.store.set_status(job_id, "running")
+
+        def progress(filename, stage, error=None):
+            try:
+                self.store.set_file_stage(job_id, filename, stage, error)
+            except Exception as e:
+                print(f"Failed to record progress of job {job_id}: {e}")
+
+        try:
+            result = fn(**params, progress=progress)
+        except Exception as e:
+            result = f"{type(e).__name__}: {e}"
+
+        try:
+            if isinstance(result, dict):
+                self.store.set_status(job_id, "completed", result=result, **self._finished())
+            else:
+                error = str(result) if result is not False else "Ingestion failed"
+                self.store.set_status(job_id, "failed", error=error, **self._finished())
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def get(self, job_id):
+        """
+        Get a job, failing it first if it is queued or running but its worker stopped updating it.
+
+        Args:
+            job_id (str): Job id. Required.
+
+        Returns:
+            dict: The job with ISO 8601 timestamps, or None if there is none.
+        """
+        job = self.store.get(job_id)
+        active = job is not None and job["status"] in ("queued", "running")
+        if active and (datetime.utcnow() - job["updated_at"]).total_seconds() > self.stale_seconds:
+            error = f"No update for {self.stale_seconds:g} seconds; the worker holding the {job['status']} job stopped"
+            if self.store.mark_stale(job_id, job["status"], job["updated_at"], error=error, **self._finished()):
+                job = self.store.get(job_id)
+        return _format_timestamps(job) if job else None
@@ -1,14 +1,24 @@
-from pymongo import MongoClient
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import os
 from dotenv import load_dotenv
 from bson import ObjectId
 from datetime import datetime, timedelta
 import calendar
+import base64
+import json
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from enum import Enum
 from typing import Dict, List, Any
 from bson import ObjectId
 from model import CourseDetails, VideoDetails
+from databaseservice.mongoClientRegistry import mongo_clients
+from blob_storage_helper import sign_document_urls
+from analytics_rollup_helper import build_day_rollups, merge_rollups, refresh_course_rollups
+from response_cache_helper import MISSING, LocalCacheBackend, MongoCacheBackend, ResponseCache, TTLCache
 
 load_dotenv()
 
@@ -20,20 +30,65 @@ mongo_uri = os.environ.get('MONGO_URI')
 print(mongo_uri)
 chat_mongo_uri = os.environ.get('COSMOS_MONGO_STRING')
 
-client = MongoClient(mongo_uri)
-chat_client = MongoClient(chat_mongo_uri)
+# Both come from the shared registry; the chat client is the same one DatabaseService uses for Cosmos
+client = mongo_clients.get_client(mongo_uri)
+chat_client = mongo_clients.get_client(chat_mongo_uri)
 
 db = client['file_database']
 chatlogs_db = chat_client['chathistory-storage']
 
+# Per-course analytics queries of a dashboard request run side by side on this pool
+analytics_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ANALYTICS_MAX_WORKERS', 8)))
+
+# Dashboards read per-course, per-day counters kept here instead of unwinding every conversation
+analytics_rollups = db["analytics_rollups"]
+analytics_rollup_state = db["analytics_rollup_state"]
+rollup_leases = db["analytics_rollup_leases"]
+# Longest pass expected; a lease left by a worker that died is taken over after it
+ROLLUP_LEASE_SECONDS = int(os.environ.get('ANALYTICS_ROLLUP_LEASE_SECONDS', 900))
+
+# Results of the /chats dashboard routes, shared by all gunicorn workers unless DASHBOARD_CACHE_BACKEND is 'local'
+if os.environ.get('DASHBOARD_CACHE_BACKEND', 'mongo') == 'local':
+    dashboard_cache_backend = LocalCacheBackend()
+else:
+    dashboard_cache_backend = MongoCacheBackend(db["dashboard_cache"])
+dashboard_cache = ResponseCache(dashboard_cache_backend, ttl_seconds=int(os.environ.get('DASHBOARD_CACHE_TTL_SECONDS', 60)))
+
+# Role of a user in a course, by (course_name, username). Entries are per worker, so a membership
+# change made through another worker is seen here once the entry expires.
+membership_cache = TTLCache(ttl_seconds=int(os.environ.get('COURSE_MEMBERSHIP_TTL_SECONDS', 30)))
+
+def course_membership(course_name, username):
+    """
+    Look up the role of a user in a course, from the cache or with one indexed query.
+
+    Args:
+        course_name (str): Course name. Required.
+        username (str): User name. Required.
+
+    Returns:
+        str: 'root_user' or 'user' for members, "403" if the course exists but the user is not a member,
+        "404" if there is no such course.
+    """
+    key = (course_name, username)
+    role = membership_cache.get(key)
+    if role is MISSING:
+        membership = db["courses"].find_one({"course_name": course_name, "user": username}, {"user_type": 1, "_id": 0})
+        if membership is not None:
+            role = membership.get("user_type", "user")
+        elif db["courses"].find_one({"course_name": course_name}, {"_id": 1}) is not None:
+            role = "403"
+        else:
+            role = "404"
+        membership_cache.set(key, role)
+    return role
+
 def upload_course(course_name, username):
     username = username.lower()
     try:
-        query_docs = db["courses"].find({"course_name": course_name})
-        query_docs = list(query_docs)
         user_type = "root_user"
 
-        if(len(query_docs) != 0):
+        if db["courses"].find_one({"course_name": course_name}, {"_id": 1}) is not None:
             user_type = "user"
 
         doc = {
@@ -43,9 +98,13 @@ def upload_course(course_name, username):
         }
         
         db["courses"].insert_one(doc)
+        membership_cache.discard(lambda key: key == (course_name, username))
+        # The user's dashboards now cover one more course
+        dashboard_cache.invalidate(username)
         new_db = client[course_name]
         if "conversations" not in new_db.list_collection_names():
             new_db.create_collection("conversations")
+            new_db["conversations"].create_index(CONVERSATION_TIMESTAMP_INDEX)
         
         if "tickets" not in new_db.list_collection_names():
             new_db.create_collection("tickets")
@@ -63,7 +122,13 @@ def delete_all_course_documents(course_name):
         db["courses"].delete_many({
             "course_name": course_name
         })
+        # A course created again under this name starts with empty dashboards and no high-water mark
+        analytics_rollups.delete_many({"course_name": course_name})
+        analytics_rollup_state.delete_many({"course_name": course_name})
         client.drop_database(course_name)
+        membership_cache.discard(lambda key: key[0] == course_name)
+        # Every member's dashboards lose the course; members are no longer known, so all entries go
+        dashboard_cache.invalidate()
         return True
     except Exception as e:
         return False
@@ -117,23 +182,19 @@ def upload_domain(domain_name, course_name):
     
 def create_document(files):
     try:
+        requests = []
         for file in files:
-            
-            db["uploaded_files"].update_many(
-                {"name": file['name'], "in_vector_store": "yes"},
-                {"$set": {"in_vector_store": "no"}}
-            )
-
-            db["uploaded_files"].update_many(
-                {"name": file['name'], "is_root_blob": "yes"},
-                {"$set": {"is_root_blob": "no"}}
-            )
-
-            db["uploaded_files"].update_one(
-                {"version_id": file['version_id']},
-                {"$set": file},           
-                upsert=True             
-            )
+            # Older versions are demoted without touching the version being written, so the
+            # operations are independent and can run unordered in one round trip
+            older_versions = {"name": file['name'], "version_id": {"$ne": file['version_id']}}
+            requests += [
+                UpdateMany({**older_versions, "in_vector_store": "yes"}, {"$set": {"in_vector_store": "no"}}),
+                UpdateMany({**older_versions, "is_root_blob": "yes"}, {"$set": {"is_root_blob": "no"}}),
+                UpdateOne({"version_id": file['version_id']}, {"$set": file}, upsert=True)
+            ]
+
+        if requests:
+            db["uploaded_files"].bulk_write(requests, ordered=False)
         return True
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -141,45 +202,80 @@ def create_document(files):
     
 def add_activity(activities):
     try:
-        for activity in activities:        
-            db["activity_log"].insert_one(
-                activity
-            )
+        if activities:
+            db["activity_log"].insert_many(activities, ordered=False)
 
         return True
     except Exception as e:
         print(f"An error occurred: {e}")
         return False
 
-def view_activities(username):
-    course_list = []
-    result = []
-    activities = []
+# Fields of an activity the admin app shows
+ACTIVITY_FIELDS = {"uername": 1, "course_name": 1, "domain": 1, "file": 1, "action": 1, "date_str": 1, "time_str": 1}
+ACTIVITY_PAGE_SIZE = int(os.environ.get('ACTIVITY_PAGE_SIZE', 500))
+ACTIVITY_MAX_PAGE_SIZE = 5000
+
+def encode_activity_cursor(activity):
+    # Opaque position of the last activity of a page; the next page starts strictly after it
+    position = [activity["date_str"], activity["time_str"], str(activity["_id"])]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_activity_cursor(cursor):
+    date_str, time_str, activity_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return date_str, time_str, ObjectId(activity_id)
+
+def view_activities(username, limit=ACTIVITY_PAGE_SIZE, cursor=None):
+    """
+    One page of the activity log of the courses a user owns, newest first.
+
+    Args:
+        username (str): User name. Required.
+        limit (int): Activities per page, at most ACTIVITY_MAX_PAGE_SIZE. Default: ACTIVITY_PAGE_SIZE.
+        cursor (str): Cursor returned with the previous page. Default: first page.
+
+    Returns:
+        Tuple[List[dict], str]: Activities and the cursor of the next page (None on the last page),
+        "400" if the cursor is not valid, or False on error.
+    """
     username = username.lower()
+    limit = max(1, min(int(limit), ACTIVITY_MAX_PAGE_SIZE))
     try:
-        documents = list(db["courses"].find({"user": username, "user_type": "root_user"}))
-        for doc in documents:
-            course_list.append(doc['course_name'])
-        
-        print(course_list)
-        for course in course_list:
-            activities = activities+list(db["activity_log"].find({"course_name": course}))
-            
-         
-        print(activities)
+        course_list = [doc["course_name"] for doc in db["courses"].find(
+            {"user": username, "user_type": "root_user"}, {"course_name": 1, "_id": 0}
+        )]
+        query = {"course_name": {"$in": course_list}}
+
+        if cursor:
+            try:
+                date_str, time_str, activity_id = decode_activity_cursor(cursor)
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                return "400"
+            query["$or"] = [
+                {"date_str": {"$lt": date_str}},
+                {"date_str": date_str, "time_str": {"$lt": time_str}},
+                {"date_str": date_str, "time_str": time_str, "_id": {"$lt": activity_id}},
+            ]
+
+        # One query over all courses, read in index order and stopped after one extra activity
+        activities = list(
+            db["activity_log"].find(query, ACTIVITY_FIELDS)
+            .sort([("date_str", -1), ("time_str", -1), ("_id", -1)])
+            .limit(limit + 1)
+        )
+        next_cursor = encode_activity_cursor(activities[limit - 1]) if len(activities) > limit else None
+        activities = activities[:limit]
         for activity in activities:
-            activity['_id'] = str(doc['_id'])   
-            result.append(activity)
-        
-        print(result)
+            activity['_id'] = str(activity['_id'])
 
-        return result
+        return activities, next_cursor
 
     except Exception as e:
         print(f"An error occurred: {e}")
         return False
         
     
+
 def update_movement_document(collectionName,fileName, versionId):
     try:    
         db["uploaded_files"].update_many(
@@ -231,28 +327,18 @@ def list_courses(username):
     
 def get_domain_files(username,course_name):
     domains_list = []
-    usertype = ''
     try:
-        documents = list(db["courses"].find({"course_name": course_name}))
-
-        if(len(documents) > 0):
-            documents = list(db["courses"].find({"course_name": course_name, "user": username}))
-            usertype = documents[0]['user_type']
-            print(usertype)
-            if(len(documents) > 0):
-                documents = list(db["uploaded_files"].find({"name": "null","course_name": course_name}))
-                for doc in documents:
-                    doc['_id'] = str(doc['_id']) 
-                    doc_to_append = {
-                        'domain': doc['domain'],
-                        'usertype': usertype
-                    }  
-                    domains_list.append(doc_to_append)
-                return domains_list
-            else:
-                return "403"
-        else:
-            return "404"
+        usertype = course_membership(course_name, username)
+        if usertype in ("403", "404"):
+            return usertype
+        documents = db["uploaded_files"].find({"name": "null","course_name": course_name}, {"domain": 1, "_id": 0})
+        for doc in documents:
+            doc_to_append = {
+                'domain': doc['domain'],
+                'usertype': usertype
+            }  
+            domains_list.append(doc_to_append)
+        return domains_list
         
     except Exception as e:
         return "False"
@@ -260,35 +346,28 @@ def get_domain_files(username,course_name):
 def get_documents(username,course_name, domain_name):
     username = username.lower()
     try:
-        documents = list(db["courses"].find({"course_name": course_name}))
+        membership = course_membership(course_name, username)
+        if membership in ("403", "404"):
+            return membership
 
-        if(len(documents) > 0):
-            documents = list(db["courses"].find({"course_name": course_name, "user": username}))
-
-            if(len(documents) > 0):    
-                documents = list(db["uploaded_files"].find({"domain": domain_name, "course_name": course_name}))    
-
-                if(len(documents) > 0):
-                    documents = list(db["uploaded_files"].find({"domain": domain_name, "course_name": course_name, "name": {"$ne": "null"}}))
-                    # Convert ObjectId to string
-                    for doc in documents:
-                        doc['_id'] = str(doc['_id'])   
-                    return documents
-                else:
-                    return "404"
-
-            else:
-                return "403"
-        else:
+        documents = list(db["uploaded_files"].find({"domain": domain_name, "course_name": course_name, "name": {"$ne": "null"}}))
+        # A domain without files still has its placeholder record; only a missing domain is a 404
+        if not documents and db["uploaded_files"].find_one({"domain": domain_name, "course_name": course_name}, {"_id": 1}) is None:
             return "404"
+        # Convert ObjectId to string
+        for doc in documents:
+            doc['_id'] = str(doc['_id'])   
+        # Links are signed on read, reusing tokens that are not about to expire
+        return sign_document_urls(documents)
 
     except Exception as e:
         return "False"
     
+
 def get_course_users(courseName):
     users_list = []
     try:
-        usersList = list(db["courses"].find({"course_name": courseName, "user_type": "user"}))
+        usersList = list(db["courses"].find({"course_name": courseName, "user_type": "user"}, {"user": 1, "_id": 0}))
         print(usersList)
         for user in usersList:
             users_list.append(user["user"])
@@ -301,6 +380,8 @@ def get_course_users(courseName):
 def detele_course_user(courseName, user):
     try:
         db["courses"].delete_one({"course_name": courseName, "user": user})
+        membership_cache.discard(lambda key: key == (courseName, user))
+        dashboard_cache.invalidate(user)
         return True
     except Exception as e:
         print(e)
@@ -319,35 +400,41 @@ def get_chatlogs():
         return False
 
 def get_course_files_count(course_name):
-    count = 0
     try:
-        documents = list(db["uploaded_files"].find({"course_name": course_name, "name": {"$ne": "null"}}))
-        # Convert ObjectId to string
-        for doc in documents:
-            count = count + 1
-        return count
+        # Counted on the server; the file records are never sent over
+        return db["uploaded_files"].count_documents({"course_name": course_name, "name": {"$ne": "null"}})
     except Exception as e:
         return "False"
     
 def get_domain_files_count(course_name, domain_name):
-    count = 0
     try:
-        documents = list(db["uploaded_files"].find({"course_name": course_name, "domain": domain_name, "name": {"$ne": "null"}}))
-        # Convert ObjectId to string
-        for doc in documents:
-            count = count + 1
-        return count
+        return db["uploaded_files"].count_documents({"course_name": course_name, "domain": domain_name, "name": {"$ne": "null"}})
     except Exception as e:
         return "False"
     
+def for_each_user_course(username, fn):
+    """
+    Run a query against the database of every course of a user, all courses at once.
+
+    Args:
+        username (str): Lower-case username. Required.
+        fn (Callable): Called with (course_db, course_name); its result is collected. Required.
+
+    Returns:
+        List[Tuple[str, Any]]: (course name, result) in course order.
+    """
+    course_names = [doc["course_name"] for doc in db["courses"].find({"user": username}, {"course_name": 1, "_id": 0})]
+    results = analytics_executor.map(lambda course: fn(client[course], course), course_names)
+    return list(zip(course_names, results))
+
 def get_users_count(username):
     username = username.lower()
     try:
         users = 0
-        user_courses_docs = list(db["courses"].find({"user": username }))
-        for doc in user_courses_docs: 
-            course_db = client[doc["course_name"]]  
-            unique_users = course_db["conversations"].distinct("user")
+        course_results = for_each_user_course(
+            username, lambda course_db, course: course_db["conversations"].distinct("user")
+        )
+        for course, unique_users in course_results:
             users = users + len(unique_users)
         
         return users
@@ -359,72 +446,104 @@ def get_queries_count(username):
     username = username.lower()
     try:
         queries_count = 0
-        user_course_queries = list(db["courses"].find({"user": username }))
-        for doc in user_course_queries:
-            course_db = client[doc["course_name"]]
-            course_queries = list(course_db["conversations"].find({"messages.role":  "user"}))
-            queries_count = queries_count + len(course_queries)
+        course_results = for_each_user_course(
+            username, lambda course_db, course: course_db["conversations"].count_documents({"messages.role": "user"})
+        )
+        for course, course_queries in course_results:
+            queries_count = queries_count + course_queries
         return  queries_count
     except Exception as e:
         return "False"
     
-def get_queries_by_month(username):
-    username = username.lower()
-    now = datetime.now()
-    start_date = now - timedelta(days=365)
+def course_rollups(course_db, course_name):
+    """
+    Per-day rollups of a course, computed from its conversations if they have not been built yet.
+
+    Args:
+        course_db (Database): The course's database. Required.
+        course_name (str): Course name. Required.
+
+    Returns:
+        List[dict]: Rollup documents of the course.
+    """
+    if analytics_rollup_state.find_one({"course_name": course_name}, {"_id": 1}) is None:
+        return build_day_rollups(course_db["conversations"], course_name)
+    return list(analytics_rollups.find(
+        {"course_name": course_name}, {"_id": 0, "day": 1, "queries": 1, "sentiments": 1, "emotions": 1}
+    ))
+
+def refresh_rollups(full=False):
+    """
+    Update the analytics rollups of every course from its high-water mark.
+
+    Args:
+        full (bool): Rebuild every course from its first message (backfill). Default: False.
+
+    Returns:
+        bool: True if every course was refreshed.
+    """
+    refreshed = True
+    for course_name in db["courses"].distinct("course_name"):
+        try:
+            conversations = client[course_name]["conversations"]
+            days = refresh_course_rollups(analytics_rollups, analytics_rollup_state, conversations, course_name, full)
+            print(f"Analytics rollups of {course_name}: {days} day(s) written")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            refreshed = False
+    return refreshed
+
+def acquire_rollup_lease(holder, lease_seconds):
+    """
+    Take the lease that lets one process, across all gunicorn workers, run a rollup refresh.
 
-    start_date = start_date.replace(day=1)
-    end_date = now.replace(day=1)
+    Args:
+        holder (str): Identifies the process taking the lease. Required.
+        lease_seconds (float): How long the lease is held unless shortened by its holder. Required.
 
+    Returns:
+        bool: True if this process holds the lease.
+    """
+    now = datetime.utcnow()
+    try:
+        # Matches only an expired lease; a live one makes the upsert collide on _id
+        rollup_leases.update_one(
+            {"_id": "refresh", "expires_at": {"$lte": now}},
+            {"$set": {"holder": holder, "expires_at": now + timedelta(seconds=lease_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+def run_rollup_refresher(interval_seconds):
+    # Background loop started by app.py in every worker; the lease makes one pass per interval run,
+    # and each pass only rereads the days after the high-water mark
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        started = datetime.utcnow()
+        try:
+            if acquire_rollup_lease(holder, ROLLUP_LEASE_SECONDS):
+                refresh_rollups()
+                # The lease stays until the next pass is due, so no other worker starts one sooner
+                rollup_leases.update_one(
+                    {"_id": "refresh", "holder": holder},
+                    {"$set": {"expires_at": started + timedelta(seconds=interval_seconds)}}
+                )
+        except Exception as e:
+            print(f"An error occurred: {e}")
+        time.sleep(interval_seconds)
+
+def get_queries_by_month(username):
+    username = username.lower()
     months = []
     counts = []
-    courses_to_include = []
-    aggregated_result = {}
 
     try:
-        user_courses = list(db["courses"].find({"user": username }))
-        for doc in user_courses:
-            courses_to_include.append(doc["course_name"])
-
-        pipeline = [
-            {
-               "$unwind": "$messages"
-             },
-             {
-                "$match": {
-                    "messages.role": "user"
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "year": { "$year": { "$toDate": { "$multiply": ["$messages.recorded_on.timestamp", 1000] } } },
-                        "month": { "$month": { "$toDate": { "$multiply": ["$messages.recorded_on.timestamp", 1000] } } }
-                    },
-                    "count": { "$sum": 1 }
-                }
-            },
-            {
-                "$sort": { "_id.year": 1, "_id.month": 1 }
-            }
-        ]
-        
-        for course in courses_to_include:
-            course_db = client[course]
-            course_result = list(course_db["conversations"].aggregate(pipeline))
-   
-            for entry in course_result:
-                year = entry["_id"]["year"]
-                month = entry["_id"]["month"]
-                count = entry["count"]
-                month_year = (year, month)
-
-                if month_year in aggregated_result:
-                    aggregated_result[month_year] += count
-                else:
-                    aggregated_result[month_year] = count
-
-        for (year, month), count in sorted(aggregated_result.items()):
+        course_results = for_each_user_course(username, course_rollups)
+        totals = merge_rollups(day for course, day_rollups in course_results for day in day_rollups)
+
+        for (year, month), count in sorted(totals["months"].items()):
             month_name = calendar.month_name[month]
             months.append(f"{month_name} {year}")
             counts.append(count)
@@ -442,38 +561,15 @@ def get_queries_by_month(username):
 def get_queries_by_course(username):
     username = username.lower()
      
-    courses_to_include = []
     courses = []
     counts = []
     try:
-        user_courses = list(db["courses"].find({"user": username }))
-        for doc in user_courses:
-            courses_to_include.append(doc["course_name"])
-        
-        pipeline = [
-            {
-               "$unwind": "$messages"
-             },
-             {
-                "$match": {
-                    "messages.role": "user"
-                }
-            },
-            {
-                "$group": {
-                    "_id": None,  
-                    "count": { "$sum": 1 }  
-                }
-            }
-        ]
-
-        for course in courses_to_include:
-            course_db = client[course]
-            course_result = list(course_db["conversations"].aggregate(pipeline))
-
-            if course_result:
+        course_results = for_each_user_course(username, course_rollups)
+        for course, day_rollups in course_results:
+            queries = merge_rollups(day_rollups)["queries"]
+            if queries:
                 courses.append(course)
-                counts.append(course_result[0]["count"])
+                counts.append(queries)
         output = {
             "courses": courses,
             "counts": counts
@@ -486,48 +582,14 @@ def get_queries_by_course(username):
 
 def get_user_sentiments(username):
     username = username.lower()
-    courses_to_include = []
     counts = []
     sentiments = []
-    aggregated_sentiments = {}
 
     try:
-        user_courses = list(db["courses"].find({"user": username }))
-        for doc in user_courses:
-            courses_to_include.append(doc["course_name"])
-        
-   
-        pipeline = [
-            {
-                "$unwind": "$messages"
-            },
-            {
-                "$match": {
-                    "messages.role": "user" 
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$messages.sentiment", 
-                    "count": { "$sum": 1 }  
-                }
-            }
-        ]
-
-        for course in courses_to_include:
-            course_db = client[course]  
-            course_result = list(course_db["conversations"].aggregate(pipeline)) 
-            
-            for entry in course_result:
-                sentiment = entry["_id"]
-                count = entry["count"]
-
-                if sentiment in aggregated_sentiments:
-                    aggregated_sentiments[sentiment] += count
-                else:
-                    aggregated_sentiments[sentiment] = count
+        course_results = for_each_user_course(username, course_rollups)
+        totals = merge_rollups(day for course, day_rollups in course_results for day in day_rollups)
                 
-        for sentiment, count in sorted(aggregated_sentiments.items()):
+        for sentiment, count in sorted(totals["sentiments"].items()):
             sentiments.append(sentiment)
             counts.append(count)
 
@@ -546,46 +608,13 @@ def get_user_emotions(username):
 
     username = username.lower()
 
-    courses_to_include = []
     emotions = []
     counts = []
-    aggregated_emotions = {}
     try:
-        user_courses = list(db["courses"].find({"user": username }))
-        for doc in user_courses:
-            courses_to_include.append(doc["course_name"])
-        
-        pipeline = [
-            {
-                "$unwind": "$messages"
-            },
-            {
-                "$match": {
-                    "messages.role": "user" 
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$messages.emotion", 
-                    "count": { "$sum": 1 }  
-                }
-            }
-        ]
-
-        for course in courses_to_include:
-            course_db = client[course]  
-            course_result = list(course_db["conversations"].aggregate(pipeline)) 
-            
-            for entry in course_result:
-                emotion = entry["_id"]
-                count = entry["count"]
-
-                if emotion in aggregated_emotions:
-                    aggregated_emotions[emotion] += count
-                else:
-                    aggregated_emotions[emotion] = count
+        course_results = for_each_user_course(username, course_rollups)
+        totals = merge_rollups(day for course, day_rollups in course_results for day in day_rollups)
                 
-        for emotion, count in sorted(aggregated_emotions.items()):
+        for emotion, count in sorted(totals["emotions"].items()):
             emotions.append(emotion)
             counts.append(count)
 
@@ -600,14 +629,121 @@ def get_user_emotions(username):
         return "False"
 
 def check_if_rec_exists(username, course_name):
-     user_courses = list(db["courses"].find({"user": username, "course_name": course_name }))
-     user_courses = list(user_courses)
-     if(len(user_courses) != 0):
+     user_course = db["courses"].find_one({"user": username, "course_name": course_name }, {"_id": 1})
+     if user_course is not None:
          return True
      else:
          return False
      
 
+# Indexes of file_database, one per query shape of the helpers above. Each entry is
+# (collection, keys); create_index is a no-op for indexes that already exist.
+FILE_DB_INDEXES = [
+    ("courses", [("course_name", 1), ("user", 1)]),
+    ("courses", [("course_name", 1), ("user_type", 1)]),
+    ("courses", [("user", 1), ("user_type", 1)]),
+    ("uploaded_files", [("course_name", 1), ("domain", 1), ("name", 1)]),
+    ("uploaded_files", [("course_name", 1), ("name", 1)]),
+    ("uploaded_files", [("name", 1), ("in_vector_store", 1)]),
+    ("uploaded_files", [("name", 1), ("is_root_blob", 1)]),
+    ("uploaded_files", [("version_id", 1)]),
+    ("activity_log", [("course_name", 1), ("date_str", 1), ("time_str", 1), ("_id", 1)]),
+]
+
+# Lets a rollup refresh skip conversations with no message after its high-water mark
+CONVERSATION_TIMESTAMP_INDEX = [("messages.recorded_on.timestamp", 1)]
+
+# Unique, so concurrent refreshes can never leave two documents for one course and day
+ROLLUP_INDEXES = [
+    ("analytics_rollups", [("course_name", 1), ("day_start", 1)]),
+    ("analytics_rollup_state", [("course_name", 1)]),
+]
+
+# Filters the helpers send to file_database, with sample values, for the query plan check
+FILE_DB_QUERIES = [
+    ("courses", {"course_name": "course"}),
+    ("courses", {"course_name": "course", "user": "user"}),
+    ("courses", {"course_name": "course", "user_type": "user"}),
+    ("courses", {"user": "user"}),
+    ("courses", {"user": "user", "user_type": "root_user"}),
+    ("courses", {"user": "user", "course_name": "course"}),
+    ("uploaded_files", {"course_name": "course"}),
+    ("uploaded_files", {"course_name": "course", "domain": "domain"}),
+    ("uploaded_files", {"domain": "domain", "course_name": "course", "name": {"$ne": "null"}}),
+    ("uploaded_files", {"course_name": "course", "name": {"$ne": "null"}}),
+    ("uploaded_files", {"name": "null", "course_name": "course"}),
+    ("uploaded_files", {"domain": "domain", "course_name": "course"}),
+    ("uploaded_files", {"name": "file", "in_vector_store": "yes"}),
+    ("uploaded_files", {"name": "file", "version_id": {"$ne": "version"}, "in_vector_store": "yes"}),
+    ("uploaded_files", {"name": "file", "version_id": {"$ne": "version"}, "is_root_blob": "yes"}),
+    ("uploaded_files", {"name": "file"}),
+    ("uploaded_files", {"version_id": "version"}),
+    ("activity_log", {"course_name": "course"}),
+    ("activity_log", {"course_name": {"$in": ["course", "other course"]}}),
+    ("analytics_rollups", {"course_name": "course"}),
+    ("analytics_rollup_state", {"course_name": "course"}),
+]
+
+# Call once on startup (e.g., from app.py); safe to repeat
+def _ensure_rollup_indexes():
+    try:
+        for collection, keys in ROLLUP_INDEXES:
+            db[collection].create_index(keys, unique=True)
+    except OperationFailure as e:
+        # A non-unique index of an earlier release, or duplicate days left by one. Rollups are derived
+        # data, so both collections are dropped and the next refresh rebuilds them from the conversations.
+        print(f"An error occurred: {e}")
+        analytics_rollups.drop()
+        analytics_rollup_state.drop()
+        for collection, keys in ROLLUP_INDEXES:
+            db[collection].create_index(keys, unique=True)
+
+def ensure_indexes():
+    try:
+        for collection, keys in FILE_DB_INDEXES:
+            db[collection].create_index(keys)
+        _ensure_rollup_indexes()
+        # New courses get it in upload_course; this covers the courses created before
+        for course_name in db["courses"].distinct("course_name"):
+            client[course_name]["conversations"].create_index(CONVERSATION_TIMESTAMP_INDEX)
+        # Expired dashboard cache entries and leases are removed by the server
+        db["dashboard_cache"].create_index("expires_at", expireAfterSeconds=0)
+        # Finished ingestion jobs carry their expiry; running ones have none and are kept
+        db["ingestion_jobs"].create_index("expires_at", expireAfterSeconds=0)
+        return True
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return False
+
+def _plan_stages(plan):
+    # Stage names anywhere in an explain() plan tree
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+def find_collection_scans(queries=FILE_DB_QUERIES):
+    """
+    Explain every helper query and report those whose winning plan scans the whole collection.
+
+    Args:
+        queries (List[Tuple[str, dict]]): (collection, filter) pairs. Default: FILE_DB_QUERIES.
+
+    Returns:
+        List[Tuple[str, dict]]: Queries planned as a COLLSCAN.
+    """
+    scans = []
+    for collection, query in queries:
+        explanation = db[collection].find(query).explain()
+        winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", explanation)
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            scans.append((collection, query))
+    return scans
+
 #Video analyzer DB (Cosmos for Mongo vCore)
 vi_db = chat_client['videoindexer']               
 vi_courses = vi_db['course']      
@@ -0,0 +1,168 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz  # PyMuPDF
+
+from common_helper import file_iterators
+
+
+def _parse_pdf_range(path, start, stop):
+    with fitz.open(path) as document:
+        return [document.load_page(page_num).get_text() for page_num in range(start, stop)]
+
+
+def _parse_file(path, ext):
+    return list(file_iterators[ext](path))
+
+
+def _record_worker_pid(worker_pids):
+    # Pool initializer: lets the executor stop this process without reaching into the pool
+    worker_pids.put(os.getpid())
+
+
+class _WorkerPool:
+    """A process pool with the pids of its workers and the jobs submitted to it that are not done yet."""
+
+    def __init__(self, max_workers):
+        context = multiprocessing.get_context("spawn")
+        self.worker_pids = context.SimpleQueue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=context,
+            initializer=_record_worker_pid, initargs=(self.worker_pids,)
+        )
+        self.pending = set()
+
+
+class ParsingExecutor:
+    """
+    Parses PDF, DOCX, PPTX and TXT files in a process pool so CPU-bound parsing does not hold
+    the GIL of the gunicorn worker. Large PDFs are split into page ranges parsed in parallel.
+
+    Args:
+        max_workers (int): Parser processes. Default: 2.
+        timeout (float): Seconds allowed to parse one file. Default: 300.
+        max_pages_per_job (int): Pages parsed by one job; larger PDFs are split into ranges. Default: 50.
+    """
+
+    def __init__(self, max_workers: int = 2, timeout: float = 300, max_pages_per_job: int = 50):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_pages_per_job = max_pages_per_job
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._queued_jobs = 0
+        self._retired_pools = 0
+        self._format_stats = {}
+
+    def _get_pool(self):
+        # Pools do not survive a fork; spawn keeps children free of the worker's threads and sockets
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pool = _WorkerPool(self.max_workers)
+            return self._pool
+
+    def _retire_pool(self, pool, stuck):
+        """
+        Stop sending jobs to a pool whose jobs timed out or broke it. A running parse cannot be
+        cancelled, so the pool's processes are stopped, but only once the jobs other requests
+        have on it are done; new jobs go to a fresh pool meanwhile.
+        """
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self._retired_pools += 1
+            others = [future for future in pool.pending if future not in stuck]
+        for future in stuck:
+            future.cancel()
+        threading.Thread(target=self._stop_pool, args=(pool, others), daemon=True).start()
+
+    def _stop_pool(self, pool, others):
+        # Other jobs have their own deadlines, so waiting for them is bounded by the timeout
+        wait(others, timeout=self.timeout)
+        pool.executor.shutdown(wait=False, cancel_futures=True)
+        while not pool.worker_pids.empty():
+            try:
+                os.kill(pool.worker_pids.get(), signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _job_done(self, pool, future):
+        with self._lock:
+            self._queued_jobs -= 1
+            pool.pending.discard(future)
+
+    def _submit(self, pool, fn, *args):
+        future = pool.executor.submit(fn, *args)
+        with self._lock:
+            self._queued_jobs += 1
+            pool.pending.add(future)
+        future.add_done_callback(lambda done: self._job_done(pool, done))
+        return future
+
+    def parse(self, path: str, ext: str):
+        """
+        Parse a file into its pages, slides or paragraphs, yielding each job's pieces as soon as it is done.
+
+        Args:
+            path (str): Local path of the file. Required.
+            ext (str): Lower-case extension, e.g. '.pdf'. Required.
+
+        Returns:
+            Iterator[str]: Text pieces in document order.
+        """
+        deadline = time.monotonic() + self.timeout
+        pool = self._get_pool()
+
+        if ext == '.pdf':
+            with fitz.open(path) as document:
+                page_count = len(document)
+            futures = [
+                self._submit(pool, _parse_pdf_range, path, start, min(start + self.max_pages_per_job, page_count))
+                for start in range(0, page_count, self.max_pages_per_job)
+            ]
+        else:
+            futures = [self._submit(pool, _parse_file, path, ext)]
+
+        pieces = 0
+        waited = 0.0
+        try:
+            for future in futures:
+                wait_start = time.perf_counter()
+                job_pieces = future.result(timeout=max(deadline - time.monotonic(), 0))
+                waited += time.perf_counter() - wait_start
+                pieces += len(job_pieces)
+                yield from job_pieces
+        except TimeoutError:
+            self._retire_pool(pool, futures)
+            raise TimeoutError(f"Parsing {os.path.basename(path)} took longer than {self.timeout}s")
+        except BrokenProcessPool:
+            self._retire_pool(pool, futures)
+            raise
+
+        # Time spent waiting for the parser processes, not consuming the pieces
+        with self._lock:
+            stats = self._format_stats.setdefault(ext, {"files": 0, "pages": 0, "seconds": 0.0, "max_seconds": 0.0})
+            stats["files"] += 1
+            stats["pages"] += pieces
+            stats["seconds"] += waited
+            stats["max_seconds"] = max(stats["max_seconds"], waited)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Jobs waiting or running, and parse counts and times per format.
+        """
+        with self._lock:
+            return {
+                "queued_jobs": self._queued_jobs,
+                "retired_pools": self._retired_pools,
+                "formats": {ext: dict(stats) for ext, stats in self._format_stats.items()}
+            }
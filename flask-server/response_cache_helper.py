@@ -0,0 +1,268 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+# Returned by a backend when it holds no live entry for a key
+MISSING = object()
+
+
+class LocalCacheBackend:
+    """
+    In-process cache backend. Every gunicorn worker keeps its own entries, so it is meant for
+    tests and local runs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._leases = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return MISSING
+            return entry[0]
+
+    def set(self, key, username, value, ttl_seconds):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl_seconds, username)
+
+    def acquire(self, key, lease_seconds):
+        with self._lock:
+            if self._leases.get(key, 0) > time.monotonic():
+                return False
+            self._leases[key] = time.monotonic() + lease_seconds
+            return True
+
+    def leased(self, key):
+        with self._lock:
+            return self._leases.get(key, 0) > time.monotonic()
+
+    def release(self, key):
+        with self._lock:
+            self._leases.pop(key, None)
+
+    def delete(self, username=None):
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if username is None or entry[2] == username]:
+                del self._entries[key]
+
+
+class MongoCacheBackend:
+    """
+    Cache backend backed by a Mongo collection, so every gunicorn worker sees the same entries and leases.
+    Expired documents are ignored on read and removed by the TTL index on 'expires_at'.
+
+    Args:
+        collection (Collection): Collection holding one document per entry or lease. Required.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, key):
+        doc = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}}, {"value": 1})
+        return MISSING if doc is None else doc["value"]
+
+    def set(self, key, username, value, ttl_seconds):
+        self.collection.replace_one(
+            {"_id": key},
+            {"username": username, "value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl_seconds)},
+            upsert=True
+        )
+
+    def acquire(self, key, lease_seconds):
+        now = datetime.utcnow()
+        # A lease left behind by a worker that died is taken over once it expires
+        self.collection.delete_one({"_id": f"lease:{key}", "expires_at": {"$lte": now}})
+        try:
+            self.collection.insert_one({"_id": f"lease:{key}", "lease": True, "expires_at": now + timedelta(seconds=lease_seconds)})
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def leased(self, key):
+        return self.collection.find_one({"_id": f"lease:{key}", "expires_at": {"$gt": datetime.utcnow()}}, {"_id": 1}) is not None
+
+    def release(self, key):
+        self.collection.delete_one({"_id": f"lease:{key}"})
+
+    def delete(self, username=None):
+        query = {"lease": {"$ne": True}}
+        if username is not None:
+            query["username"] = username
+        self.collection.delete_many(query)
+
+
+class ResponseCache:
+    """
+    Cache of endpoint results keyed by (endpoint, username), with single-flight computation:
+    while one request computes an entry, identical requests wait for its result instead of
+    computing it again.
+
+    Args:
+        backend (LocalCacheBackend | MongoCacheBackend): Where entries and leases are kept. Required.
+        ttl_seconds (float): How long an entry is served. Default: 60.
+        lease_seconds (float): Longest wait for another request's computation before computing anyway. Default: 30.
+        poll_seconds (float): Interval between checks for another request's result. Default: 0.05.
+    """
+
+    def __init__(self, backend, ttl_seconds=60, lease_seconds=30, poll_seconds=0.05):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def _count(self, endpoint, outcome):
+        with self._lock:
+            counters = self._counters.setdefault(endpoint, {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0})
+            counters[outcome] += 1
+
+    def _lookup(self, key):
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return MISSING
+
+    def _compute(self, endpoint, key, username, compute):
+        self._count(endpoint, "misses")
+        value = compute(username)
+        # Helpers report failures as "False"; those are never cached
+        if value != "False":
+            try:
+                self.backend.set(key, username, value, self.ttl_seconds)
+            except Exception as e:
+                print(f"An error occurred: {e}")
+        else:
+            self._count(endpoint, "errors")
+        return value
+
+    def get_or_compute(self, endpoint, username, compute):
+        """
+        Return the cached result of an endpoint for a user, computing it if there is none.
+
+        Args:
+            endpoint (str): Endpoint name, part of the key. Required.
+            username (str): User name, part of the key; lower-cased. Required.
+            compute (Callable[[str], Any]): Computes the result from the username. Required.
+
+        Returns:
+            Any: The cached or computed result.
+        """
+        username = username.lower()
+        key = f"{endpoint}:{username}"
+        value = self._lookup(key)
+        if value is not MISSING:
+            self._count(endpoint, "hits")
+            return value
+
+        try:
+            leader = self.backend.acquire(key, self.lease_seconds)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return self._compute(endpoint, key, username, compute)
+
+        if leader:
+            try:
+                return self._compute(endpoint, key, username, compute)
+            finally:
+                self.backend.release(key)
+
+        # Another request holds the lease: wait for its result, or compute once it gives up
+        deadline = time.monotonic() + self.lease_seconds
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_seconds)
+            value = self._lookup(key)
+            if value is not MISSING:
+                self._count(endpoint, "coalesced")
+                return value
+            if not self.backend.leased(key):
+                break
+        return self._compute(endpoint, key, username, compute)
+
+    def invalidate(self, username=None):
+        """
+        Drop cached entries.
+
+        Args:
+            username (str): Only drop this user's entries. Default: all users.
+
+        Returns:
+            bool: True if the entries were dropped.
+        """
+        try:
+            self.backend.delete(username.lower() if username is not None else None)
+            return True
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return False
+
+    def stats(self):
+        """
+        Hit, miss, coalesced and error counts of this worker, per endpoint and in total.
+        """
+        with self._lock:
+            endpoints = {endpoint: dict(counters) for endpoint, counters in self._counters.items()}
+        totals = {outcome: sum(c[outcome] for c in endpoints.values()) for outcome in ("hits", "misses", "coalesced", "errors")}
+        lookups = totals["hits"] + totals["coalesced"] + totals["misses"]
+        return {
+            "pid": os.getpid(),
+            "backend": type(self.backend).__name__,
+            "ttl_seconds": self.ttl_seconds,
+            **totals,
+            "hit_ratio": round((totals["hits"] + totals["coalesced"]) / lookups, 3) if lookups else None,
+            "endpoints": endpoints,
+        }
+
+
+class TTLCache:
+    """
+    Small in-process map whose entries expire, evicting the least recently used entry when full.
+
+    Args:
+        ttl_seconds (float): How long an entry is served. Required.
+        max_entries (int): Entries kept at most. Default: 10000.
+    """
+
+    def __init__(self, ttl_seconds, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                self._misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, predicate):
+        # Drops every entry whose key satisfies the predicate
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self._hits, "misses": self._misses}
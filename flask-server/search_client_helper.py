@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.search.documents import SearchClient
+from azure.search.documents.indexes import SearchIndexClient
+
+
+class SearchClientRegistry:
+    """
+    Hands out long-lived Azure AI Search clients. All clients share one keep-alive HTTP session, so
+    requests to any index reuse pooled connections instead of opening a new TLS connection per call.
+    Search clients are kept per index name, least recently used first out, and the registry
+    remembers for a while which indexes exist so they are not looked up on every ingestion.
+    Another worker may delete an index meanwhile; callers that get a ResourceNotFoundError call
+    forget_index so the next ingestion creates it again.
+
+    Args:
+        endpoint (str): Search service endpoint. Required.
+        key (str): Admin API key. Required.
+        max_clients (int): Search clients kept at once. Default: 32.
+        pool_size (int): Pooled connections to the service. Default: 16.
+        index_ttl_seconds (float): How long an index is known to exist before it is looked up again. Default: 60.
+    """
+
+    def __init__(self, endpoint: str, key: str, max_clients: int = 32, pool_size: int = 16,
+                 index_ttl_seconds: float = 60):
+        self.endpoint = endpoint
+        self.credential = AzureKeyCredential(key) if key else None
+        self.max_clients = max_clients
+        self.pool_size = pool_size
+        self.index_ttl_seconds = index_ttl_seconds
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._index_client = None
+        self._search_clients = OrderedDict()
+        # Index name -> time (monotonic) until which it is known to exist
+        self._known_indexes = {}
+
+    def _transport(self):
+        # Called with the lock held. Sessions and their sockets do not survive a fork.
+        if self._session is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+            self._index_client = None
+            self._search_clients.clear()
+        return RequestsTransport(session=self._session, session_owner=False)
+
+    def get_search_client(self, index_name: str):
+        """
+        Args:
+            index_name (str): Name of the index. Required.
+
+        Returns:
+            SearchClient: Shared client of the index.
+        """
+        with self._lock:
+            transport = self._transport()
+            client = self._search_clients.get(index_name)
+            if client is not None:
+                self._search_clients.move_to_end(index_name)
+                return client
+            client = SearchClient(self.endpoint, index_name, self.credential, transport=transport)
+            self._search_clients[index_name] = client
+            if len(self._search_clients) > self.max_clients:
+                # Dropped, not closed: another thread may still be using it. The shared session stays open.
+                self._search_clients.popitem(last=False)
+            return client
+
+    def get_index_client(self):
+        """
+        Returns:
+            SearchIndexClient: Shared client for index management.
+        """
+        with self._lock:
+            transport = self._transport()
+            if self._index_client is None:
+                self._index_client = SearchIndexClient(self.endpoint, self.credential, transport=transport)
+            return self._index_client
+
+    def index_exists(self, index_name: str):
+        """
+        Check whether an index exists, asking the service only for indexes not seen recently.
+
+        Args:
+            index_name (str): Name of the index. Required.
+
+        Returns:
+            bool: True if the index exists.
+        """
+        with self._lock:
+            if self._known_indexes.get(index_name, 0) > time.monotonic():
+                return True
+        try:
+            self.get_index_client().get_index(index_name)
+        except ResourceNotFoundError:
+            return False
+        self.mark_index(index_name)
+        return True
+
+    def mark_index(self, index_name: str):
+        """Remember that an index exists, e.g. after creating it."""
+        with self._lock:
+            self._known_indexes[index_name] = time.monotonic() + self.index_ttl_seconds
+
+    def forget_index(self, index_name: str):
+        """Drop a deleted index from the existence cache, along with its search client."""
+        with self._lock:
+            self._known_indexes.pop(index_name, None)
+            # Not closed: requests still running may hold it
+            self._search_clients.pop(index_name, None)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Cached search clients and known indexes.
+        """
+        with self._lock:
+            return {
+                "search_clients": list(self._search_clients),
+                "known_indexes": sorted(name for name, until in self._known_indexes.items() if until > time.monotonic()),
+                "max_clients": self.max_clients
+            }
@@ -0,0 +1,52 @@
+from datetime import datetime, timezone as dt_timezone
+
+from pytz import timezone
+
+# Dates and times shown in the admin app are Singapore time
+LOCAL_TZ = timezone('Asia/Singapore')
+
+
+def local_date_time(ts_utc: datetime = None):
+    """
+    Format a UTC timestamp as local date and time strings.
+
+    Args:
+        ts_utc (datetime): Timezone-aware timestamp. Default: now.
+
+    Returns:
+        Tuple[str, str]: ('YYYY-MM-DD', 'HH:MM:SS') in local time.
+    """
+    ts_local = (ts_utc or datetime.now(dt_timezone.utc)).astimezone(LOCAL_TZ)
+    return ts_local.date().isoformat(), ts_local.strftime('%H:%M:%S')
+
+
+def parse_version_id(version_id):
+    """
+    Parse a blob version id such as '2024-05-01T08:30:12.1234567Z' into a UTC datetime.
+
+    Args:
+        version_id (str): Version id returned by Azure Blob Storage. Required.
+
+    Returns:
+        datetime: Timezone-aware timestamp, or None if it is not a timestamp.
+    """
+    if not isinstance(version_id, str):
+        return None
+    try:
+        return datetime.fromisoformat(version_id)
+    except ValueError:
+        return None
+
+
+def blob_date_time(version_id, last_modified):
+    """
+    Local date and time a blob version was written, from its version id or else its last-modified time.
+
+    Args:
+        version_id (str): Version id, may be None. Required.
+        last_modified (datetime): Timezone-aware last-modified time of the blob. Required.
+
+    Returns:
+        Tuple[str, str]: ('YYYY-MM-DD', 'HH:MM:SS') in local time.
+    """
+    return local_date_time(parse_version_id(version_id) or last_modified)
@@ -7,6 +7,7 @@ from langchain_community.vectorstores.azure_cosmos_db import CosmosDBVectorSearc
 from langchain_core.documents import Document
 
 from EmbeddingService import EmbeddingService
+from embedding_helper import get_embedding_batcher
 from langchain_community.vectorstores import AzureCosmosDBVectorSearch
 from langchain_openai import AzureOpenAIEmbeddings
 
@@ -46,10 +47,10 @@ class TranscriptRepositoryService:
             azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
             model=os.environ.get("EMBEDDING_MODEL")
         )
+        self.batched_embeddings = get_embedding_batcher(os.environ.get("EMBEDDING_MODEL"), self.azure_openai_embeddings)
 
-        self.vector_store: AzureCosmosDBVectorSearch = AzureCosmosDBVectorSearch.from_connection_string(
-            connection_string=database_service.get_mongo_connection_string(),
-            namespace=f"{database_service.get_database_name()}.{prompt_collection_clean_name}",
+        self.vector_store: AzureCosmosDBVectorSearch = AzureCosmosDBVectorSearch(
+            collection=db[prompt_collection_clean_name],
             embedding=self.azure_openai_embeddings,
         )
 
@@ -100,7 +101,7 @@ class TranscriptRepositoryService:
 
         AzureCosmosDBVectorSearch.from_documents(
             formatted_documents,
-            self.azure_openai_embeddings,
+            self.batched_embeddings,
             collection=self.prompt_collection_clean_collection,
             index_name="test",
         )
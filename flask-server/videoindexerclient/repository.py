@@ -9,6 +9,7 @@ from langchain_community.vectorstores.azure_cosmos_db import CosmosDBSimilarityT
 from langchain_core.documents import Document
 
 from EmbeddingService import EmbeddingService
+from embedding_helper import get_embedding_batcher
 from langchain_community.vectorstores import AzureCosmosDBVectorSearch
 from langchain_openai import AzureOpenAIEmbeddings
 
@@ -58,10 +59,10 @@ class VideoIndexerRepositoryService:
             azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
             model=os.environ.get("EMBEDDING_MODEL")
         )
+        self.batched_embeddings = get_embedding_batcher(os.environ.get("EMBEDDING_MODEL"), self.azure_openai_embeddings)
 
-        self.vector_store_prompt: AzureCosmosDBVectorSearch = AzureCosmosDBVectorSearch.from_connection_string(
-            connection_string=database_service.get_mongo_connection_string(),
-            namespace=f"{database_service.get_database_name()}.{prompt_content_index}",
+        self.vector_store_prompt: AzureCosmosDBVectorSearch = AzureCosmosDBVectorSearch(
+            collection=db[prompt_content_index],
             embedding=self.azure_openai_embeddings,
         )
 
@@ -142,7 +143,7 @@ class VideoIndexerRepositoryService:
 
         AzureCosmosDBVectorSearch.from_documents(
             formatted_documents,
-            self.azure_openai_embeddings,
+            self.batched_embeddings,
             collection=self.prompt_content_index_collection,
             index_name="test",
         )